@@ -1,7 +1,10 @@
 from .broker import SemanticBroker
-from .containers import get_broker
+from .service import BrokerService
+from .containers import get_broker, get_service
 
 __all__ = [
     "SemanticBroker",
-    "get_broker"
+    "BrokerService",
+    "get_broker",
+    "get_service"
 ]
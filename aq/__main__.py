@@ -1,13 +1,64 @@
+import argparse
 import asyncio
 import sys
 
-from aq.containers import get_broker
+from aq.containers import get_broker, get_service
+
+
+async def run_many(broker, app_file: str, activity_name: str, file_paths, max_in_flight: int) -> None:
+    try:
+        async for file_path, rv in broker.run_many(app_file, activity_name, file_paths, max_in_flight=max_in_flight):
+            print(f"{file_path}: {rv}", flush=True)
+    finally:
+        await broker.stop()
+
+
+async def run_and_stop(broker, work):
+    # The workers and the open connections of the broker are shut down once the work is done
+    try:
+        return await work
+    finally:
+        await broker.stop()
+
+
+def read_file_paths(file_paths):
+    # A single dash reads the list of files from the standard input, one path per line
+    for file_path in file_paths:
+        if file_path == "-":
+            yield from (line.strip() for line in sys.stdin if line.strip())
+        else:
+            yield file_path
 
 
 if __name__ == "__main__":
     if len(sys.argv) <= 1:
-        print("Usage: python " + sys.argv[0] + " <app file> <activity name> <file path>")
-    else:
+        print("Usage: python " + sys.argv[0] + " <app file> <activity name> <file path> [<file path> ...] "
+              "[--max-in-flight N]")
+        print("       python " + sys.argv[0] + " serve")
+        print("       python " + sys.argv[0] + " resume <app job id>")
+    elif sys.argv[1] == "resume" and len(sys.argv) == 3:
         broker = get_broker()
-        rv = asyncio.run(broker.run(*sys.argv[1:]))
+        rv = asyncio.run(run_and_stop(broker, broker.resume(sys.argv[2])))
         print(rv)
+    elif sys.argv[1] == "serve":
+        service = get_service()
+        try:
+            asyncio.run(service.serve())
+        except KeyboardInterrupt:
+            pass
+    else:
+        parser = argparse.ArgumentParser(prog="python -m aq")
+        parser.add_argument("app_file")
+        parser.add_argument("activity_name")
+        parser.add_argument("file_paths", nargs="*")
+        parser.add_argument("--max-in-flight", type=int, default=10,
+                            help="The max number of app jobs processed at once when several files are given")
+        args = parser.parse_args()
+
+        broker = get_broker()
+        if len(args.file_paths) > 1 or "-" in args.file_paths:
+            asyncio.run(run_many(broker, args.app_file, args.activity_name,
+                                 read_file_paths(args.file_paths), args.max_in_flight))
+        else:
+            rv = asyncio.run(run_and_stop(broker, broker.run(args.app_file, args.activity_name, *args.file_paths)))
+            print(rv)
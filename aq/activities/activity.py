@@ -2,24 +2,71 @@ import json
 import re
 import secrets
 import string
-from typing import Dict, List
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 
-from jinja2 import Template
-from jsonpath_ng import parse
+from jinja2 import Environment, Template
+from jsonpath_ng import JSONPath, parse
 
 from ..providers.types import Content
-from ..types import ActivityJob
+from ..types import Activity, ActivityJob, App, Model
 
 
-def jsonpath(value: str, path: str) -> str:
-    if not isinstance(value, str):
-        value = json.dumps(value)
-    expr = parse(path)
-    for match in expr.find(json.loads(value)):
+@lru_cache(maxsize=1024)
+def compile_jsonpath(path: str) -> JSONPath:
+    # Parsing builds a new PLY parser, so compiled expressions are shared by the whole process
+    return parse(path)
+
+
+def jsonpath(value: Any, path: str) -> Any:
+    if isinstance(value, str):
+        value = json.loads(value)
+    expr = compile_jsonpath(path)
+    for match in expr.find(value):
         return match.value
     return ""
 
 
+template_environment = Environment()
+template_environment.globals.update({
+    "jsonpath": jsonpath
+})
+
+
+def to_text(value: Any) -> str:
+    # Structured values are serialized only where text is required
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def to_value(value: Any) -> Any:
+    # Parse text that holds JSON and leave structured values as they are
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+    return value
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str) -> Template:
+    # Call a function to process path expressions
+    str_template = template
+    expr = r'{{([^.\[]+)([.\[])(.*)}}'
+    for match in re.finditer(expr, template):
+        activity_name = match.group(1)
+        start_of_expression = match.group(2)
+        path_expression = match.group(3)
+        str_template = str_template.replace(match.group(0),
+                                            '{{' +
+                                            f'jsonpath({activity_name}, "$.{start_of_expression}{path_expression}")'
+                                            + '}}',
+                                            1)
+
+    # Compiled templates are shared by all jobs that render the same prompt
+    return template_environment.from_string(str_template)
+
+
 class ActivityError(Exception):
     pass
 
@@ -27,28 +74,45 @@ class ActivityError(Exception):
 class BaseActivity:
     MAX_ITERATIONS = 42
 
-    async def perform(self, activity_job: ActivityJob, inputs: Dict[str, str]) -> None:
+    async def perform(self, activity_job: ActivityJob, inputs: Dict[str, Any]) -> None:
         pass
 
+    def supports_choices(self, activity: Activity) -> bool:
+        # Whether one model request can produce the outputs of all the jobs of an activity with a count
+        return False
+
+    async def perform_choices(self, activity_jobs: List[ActivityJob], inputs: Dict[str, Any]) -> None:
+        for activity_job in activity_jobs:
+            await self.perform(activity_job, inputs)
+
     @staticmethod
-    def merge_inputs(inputs: Dict[str, str]) -> str:
-        return "\n\n".join(inputs.values())
+    def merge_inputs(inputs: Dict[str, Any]) -> str:
+        return "\n\n".join(to_text(value) for value in inputs.values())
 
     @staticmethod
-    def merge_inputs_json(inputs: Dict[str, str], indent=2) -> str:
-        rval = {}
-        for key, val in inputs.items():
-            try:
-                rval[key] = json.loads(val)
-            except json.JSONDecodeError:
-                rval[key] = val
+    def merge_inputs_json(inputs: Dict[str, Any]) -> Any:
+        rval = {key: to_value(val) for key, val in inputs.items()}
         if len(rval.keys()) == 1:
             value = next(iter(rval.values()))
             if isinstance(value, list) and len(value) == 1:
                 value = value[0]
-            return json.dumps(value, indent=indent)
+            return value
         else:
-            return json.dumps(rval, indent=indent)
+            return rval
+
+    @staticmethod
+    def get_alternatives(app: App, activity: Activity) -> List[Model]:
+        # The models after the first one take the requests when the first one is unhealthy, slow or failing
+        return [app.models[name] for name in (activity.models or [])[1:]]
+
+    @staticmethod
+    def is_hedged(activity: Activity) -> bool:
+        return bool(activity.parameters.get("hedge", False))
+
+    @staticmethod
+    def get_hedge_delay(activity: Activity) -> Optional[float]:
+        hedge_after = activity.parameters.get("hedge_after", None)
+        return float(hedge_after) if hedge_after is not None else None
 
     @staticmethod
     def generate_temp_filename(prefix, extension, length=8):
@@ -56,42 +120,17 @@ class BaseActivity:
         return f"{prefix}_{random_string}.{extension}"
 
     @staticmethod
-    def render(template: str, inputs: Dict[str, str]) -> str:
-        inputs_json = {}
-        for key, val in inputs.items():
-            try:
-                inputs_json[key] = json.loads(val)
-            except json.JSONDecodeError:
-                inputs_json[key] = val
-
-        # Call a function to process path expressions
-        str_template = template
-        expr = r'{{([^.\[]+)([.\[])(.*)}}'
-        for match in re.finditer(expr, template):
-            activity_name = match.group(1)
-            start_of_expression = match.group(2)
-            path_expression = match.group(3)
-            str_template = str_template.replace(match.group(0),
-                                                '{{' +
-                                                f'jsonpath({activity_name}, "$.{start_of_expression}{path_expression}")'
-                                                + '}}',
-                                                1)
-
-        # Render the template
-        jinja_template = Template(str_template)
-        jinja_template.globals.update({
-            "jsonpath": jsonpath
-        })
-
-        return jinja_template.render(inputs_json)
+    def render(template: str, inputs: Dict[str, Any]) -> str:
+        inputs_json = {key: to_value(val) for key, val in inputs.items()}
+        return compile_template(template).render(inputs_json)
 
     @staticmethod
-    def render_prompt(template: str, inputs: Dict[str, str]) -> str | List[Content]:
+    def render_prompt(template: str, inputs: Dict[str, Any]) -> str | List[Content]:
         text = BaseActivity.render(template, inputs)
 
         contents = []
         for key in inputs:
-            if inputs[key].startswith("data:image"):
+            if isinstance(inputs[key], str) and inputs[key].startswith("data:image"):
                 contents.append(Content(type="image_url", image_url=inputs[key]))
 
         if len(contents) > 0:
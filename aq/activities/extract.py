@@ -27,6 +27,9 @@ class ExtractActivity(BaseActivity):
             if len(activity.models) < 1:
                 raise ActivityError("A model is required")
             model = app.models[activity.models[0]]
+            alternatives = self.get_alternatives(app, activity)
+            hedge = self.is_hedged(activity)
+            hedge_delay = self.get_hedge_delay(activity)
 
             schema = activity.parameters.get("schema", None)
             if not schema:
@@ -51,7 +54,6 @@ class ExtractActivity(BaseActivity):
             messages.append(ChatCompletionMessage(role="user", content=self.merge_inputs(inputs)))
 
             values: Dict[str, List[Any]] = {}
-            provider = self._provider_manager.get_provider(model.provider)
             for x in range(self.MAX_ITERATIONS):
                 request = ChatCompletionRequest(
                     model=model.model,
@@ -60,7 +62,8 @@ class ExtractActivity(BaseActivity):
                     tools=tools,
                     tool_choice="auto"
                 )
-                response = await provider.create_completion(request)
+                response = await self._provider_manager.create_completion(model.provider, request, alternatives,
+                                                                          hedge, hedge_delay)
 
                 choice: Choice = response.choices[0]
                 message: ChatCompletionMessage = choice.message
@@ -84,7 +87,7 @@ class ExtractActivity(BaseActivity):
                     break
 
             activity_job.state = JobState.SUCCESS
-            activity_job.output = json.dumps(values)
+            activity_job.output = values
             activity_job.output_type = "application/json"
 
         except Exception as e:
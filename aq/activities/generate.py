@@ -1,13 +1,14 @@
+import asyncio
 import json
 import logging
 import time
 import traceback
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from datetime import date
 
 from ..providers import ProviderManager
-from ..providers.types import (ChatCompletionMessage, ChatCompletionRequest,
-                               Choice, ResponseFormat, Tool, ToolCall)
+from ..providers.types import (ChatCompletionMessage, ChatCompletionRequest, ChatCompletionResponse,
+                               Choice, ResponseFormat, Tool, ToolCall, Usage)
 from ..tools import ToolManager
 from ..types import Activity, ActivityJob, App, JobState
 from .activity import ActivityError, BaseActivity
@@ -29,44 +30,20 @@ class GenerateActivity(BaseActivity):
             if len(activity.models) < 1:
                 raise ActivityError(f"A model is required")
             model = app.models[activity.models[0]]
+            alternatives = self.get_alternatives(app, activity)
+            hedge = self.is_hedged(activity)
+            hedge_delay = self.get_hedge_delay(activity)
 
             temperature = float(activity.parameters.get("temperature", model.parameters.get("temperature", 0.5)))
             max_tokens = int(activity.parameters.get("max_tokens", model.parameters.get("max_tokens", 500)))
 
-            messages = []
-            profile = app.info.profile
-            if profile:
-                messages.append(ChatCompletionMessage(role="system", content=profile))
-
             json_format = activity.parameters.get("format", None) == "json"
-            if json_format:
-                messages.append(ChatCompletionMessage(
-                    role="system",
-                    content="Provide your response in JSON format."))
-            else:
-                messages.append(ChatCompletionMessage(
-                    role="system",
-                    content="Use the tab length of two spaces when formatting nested lists in markdown."))
-
-            messages.append(ChatCompletionMessage(
-                role="system",
-                content=f"Today is {date.today()}."))
-
             tools = await self.get_tools(app, activity)
-            if tools:
-                messages.append(ChatCompletionMessage(
-                    role="system",
-                    content="Think step-by-step. Perform as many iterations as necessary "
-                            "to accomplish your goal using the tools provided."))
-
-            prompt_template = activity.parameters["prompt"]
-            prompt = self.render_prompt(prompt_template, inputs)
-            messages.append(ChatCompletionMessage(role="user", content=prompt))
+            messages = self.create_messages(app, activity, inputs, json_format, bool(tools))
 
             usage = activity_job.usage
             parts = []
             start_time = time.perf_counter()
-            provider = self._provider_manager.get_provider(model.provider)
 
             json_validation_attempts = 1
             json_output = None
@@ -82,7 +59,8 @@ class GenerateActivity(BaseActivity):
                     response_format=ResponseFormat(type="json_object") if json_format else None
                 )
 
-                response = await provider.create_completion(request)
+                response = await self._provider_manager.create_completion(model.provider, request, alternatives,
+                                                                          hedge, hedge_delay)
 
                 usage.prompt_tokens += response.usage.prompt_tokens
                 usage.completion_tokens += response.usage.completion_tokens
@@ -120,8 +98,7 @@ class GenerateActivity(BaseActivity):
             activity_job.state = JobState.SUCCESS
             if json_format:
                 activity_job.output_type = "application/json"
-                json_output = json_output[next(iter(json_output))] if isinstance(json_output, dict) and len(json_output) == 1 else json_output
-                activity_job.output = json.dumps(json_output)
+                activity_job.output = self.unwrap_json(json_output)
             else:
                 activity_job.output = "\n\n".join(parts)
                 activity_job.output_type = "text/markdown"
@@ -132,6 +109,136 @@ class GenerateActivity(BaseActivity):
             activity_job.state = JobState.ERROR
             activity_job.output = str(e)
 
+    def supports_choices(self, activity: Activity) -> bool:
+        # A conversation with tool calls cannot be shared by several choices
+        return not activity.tools
+
+    async def perform_choices(self, activity_jobs: List[ActivityJob], inputs: Dict[str, Any]) -> None:
+        # A single request returns one choice for each job, so the prompt is sent only once
+        try:
+            app = activity_jobs[0].app_job.app
+            activity = app.activities[activity_jobs[0].activity_name]
+
+            if len(activity.models) < 1:
+                raise ActivityError(f"A model is required")
+            model = app.models[activity.models[0]]
+            alternatives = self.get_alternatives(app, activity)
+            hedge = self.is_hedged(activity)
+            hedge_delay = self.get_hedge_delay(activity)
+
+            temperature = float(activity.parameters.get("temperature", model.parameters.get("temperature", 0.5)))
+            max_tokens = int(activity.parameters.get("max_tokens", model.parameters.get("max_tokens", 500)))
+            json_format = activity.parameters.get("format", None) == "json"
+            messages = self.create_messages(app, activity, inputs, json_format, False)
+
+            async def complete(conversation: List[ChatCompletionMessage], n: int) -> ChatCompletionResponse:
+                request = ChatCompletionRequest(
+                    model=model.model,
+                    messages=conversation,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    response_format=ResponseFormat(type="json_object") if json_format else None,
+                    n=n if n > 1 else None
+                )
+                return await self._provider_manager.create_completion(model.provider, request, alternatives,
+                                                                      hedge, hedge_delay)
+
+            response = await complete(messages, len(activity_jobs))
+            self.split_usage(activity_jobs, response.usage)
+
+            choices = sorted(response.choices, key=lambda choice: choice.index)
+            if len(choices) < len(activity_jobs):
+                raise ActivityError(f"Expected {len(activity_jobs)} choices, got {len(choices)}")
+
+            # As in perform, a choice that is not valid JSON is asked for again once, in its own conversation
+            retries = []
+            for activity_job, choice in zip(activity_jobs, choices):
+                content = choice.message.content or ""
+                if not json_format:
+                    activity_job.output = content
+                    activity_job.output_type = "text/markdown"
+                    activity_job.state = JobState.SUCCESS
+                elif not self.set_json_output(activity_job, content):
+                    prompt = "The result is not valid JSON. Please provide your response in JSON format."
+                    retries.append((activity_job, [*messages, choice.message,
+                                                   ChatCompletionMessage(role="user", content=prompt)]))
+
+            responses = await asyncio.gather(*(complete(conversation, 1) for _, conversation in retries),
+                                             return_exceptions=True)
+            for (activity_job, _), response in zip(retries, responses):
+                if isinstance(response, BaseException):
+                    self._logger.error(response)
+                    activity_job.state = JobState.ERROR
+                    activity_job.output = str(response)
+                    continue
+                self.split_usage([activity_job], response.usage)
+                content = response.choices[0].message.content or ""
+                if not self.set_json_output(activity_job, content):
+                    self._logger.error(f"Got invalid JSON from the model: {content}")
+                    activity_job.state = JobState.ERROR
+                    activity_job.output = "Invalid JSON returned by the model"
+
+        except Exception as e:
+            self._logger.error(e)
+            for activity_job in activity_jobs:
+                activity_job.state = JobState.ERROR
+                activity_job.output = str(e)
+
+    def set_json_output(self, activity_job: ActivityJob, content: str) -> bool:
+        try:
+            activity_job.output = self.unwrap_json(json.loads(content))
+        except json.JSONDecodeError:
+            return False
+        activity_job.output_type = "application/json"
+        activity_job.state = JobState.SUCCESS
+        return True
+
+    @staticmethod
+    def split_usage(activity_jobs: List[ActivityJob], usage: Optional[Usage]) -> None:
+        # The tokens of a shared request are split evenly across its jobs, and the first jobs get the remainder
+        if not usage:
+            return
+        count = len(activity_jobs)
+        for n, activity_job in enumerate(activity_jobs):
+            activity_job.usage.prompt_tokens += usage.prompt_tokens // count + (n < usage.prompt_tokens % count)
+            activity_job.usage.completion_tokens += (usage.completion_tokens // count
+                                                     + (n < usage.completion_tokens % count))
+
+    def create_messages(self, app: App, activity: Activity, inputs: Dict[str, Any],
+                        json_format: bool, tools: bool) -> List[ChatCompletionMessage]:
+        messages = []
+        profile = app.info.profile
+        if profile:
+            messages.append(ChatCompletionMessage(role="system", content=profile))
+
+        if json_format:
+            messages.append(ChatCompletionMessage(
+                role="system",
+                content="Provide your response in JSON format."))
+        else:
+            messages.append(ChatCompletionMessage(
+                role="system",
+                content="Use the tab length of two spaces when formatting nested lists in markdown."))
+
+        messages.append(ChatCompletionMessage(
+            role="system",
+            content=f"Today is {date.today()}."))
+
+        if tools:
+            messages.append(ChatCompletionMessage(
+                role="system",
+                content="Think step-by-step. Perform as many iterations as necessary "
+                        "to accomplish your goal using the tools provided."))
+
+        prompt_template = activity.parameters["prompt"]
+        prompt = self.render_prompt(prompt_template, inputs)
+        messages.append(ChatCompletionMessage(role="user", content=prompt))
+        return messages
+
+    @staticmethod
+    def unwrap_json(json_output: Any) -> Any:
+        return json_output[next(iter(json_output))] if isinstance(json_output, dict) and len(json_output) == 1 else json_output
+
     async def get_tools(self, app: App, activity: Activity) -> List[Tool]:
         tools = []
         if activity.tools:
@@ -156,10 +263,9 @@ class GenerateActivity(BaseActivity):
             raise ActivityError(f"{names[0]} is not a valid tool name")
 
         tool_def = app.tools[names[0]]
-        tool_obj = self._tool_manager.get_tool(tool_def.type)
 
         arguments = json.loads(tool_call.function.arguments)
-        response = await tool_obj.invoke(names[1], arguments, tool_def)
+        response = await self._tool_manager.invoke(tool_def, names[1], arguments)
 
         return ChatCompletionMessage(
             role="tool",
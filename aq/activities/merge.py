@@ -1,11 +1,11 @@
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 import markdown
 import yaml
-import json
 
 from .activity import BaseActivity
+from ..executor import Executor
 from ..types import ActivityJob, JobState
 
 
@@ -30,7 +30,8 @@ class MergeActivity(BaseActivity):
 </body>
 </html>"""
 
-    def __init__(self):
+    def __init__(self, executor: Optional[Executor] = None):
+        self._executor = executor or Executor()
         self._logger = logging.getLogger(self.__class__.__name__)
 
     async def perform(self, activity_job: ActivityJob, inputs: Dict[str, Any]) -> None:
@@ -45,11 +46,10 @@ class MergeActivity(BaseActivity):
                 text = self.render(template, inputs)
                 output_type = "text/markdown"
             elif output_format == "json":
-                text = self.merge_inputs_json(inputs, indent=2)
+                text = self.merge_inputs_json(inputs)
                 output_type = "application/json"
             elif output_format == "yaml":
-                text = self.merge_inputs_json(inputs)
-                text = yaml.dump(json.loads(text), default_flow_style=False)
+                text = yaml.dump(self.merge_inputs_json(inputs), default_flow_style=False)
                 output_type = "text/yaml"
             else:
                 text = self.merge_inputs(inputs)
@@ -57,7 +57,7 @@ class MergeActivity(BaseActivity):
 
             # Apply formatting
             if output_format == "html":
-                text = self.HTML_TEMPLATE % markdown.markdown(text, tab_length=2)
+                text = self.HTML_TEMPLATE % await self._executor.run(markdown.markdown, text, tab_length=2)
                 output_type = "text/html"
 
             activity_job.state = JobState.SUCCESS
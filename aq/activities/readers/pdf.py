@@ -1,12 +1,22 @@
+from typing import Optional
+
 from .reader import Reader, ReaderError
+from ...executor import Executor
 import pypdf
 
 
+def extract_text(file_path: str) -> str:
+    reader = pypdf.PdfReader(file_path)
+    text = [page.extract_text() for page in reader.pages]
+    return "\n\n".join(text)
+
+
 class PdfReader(Reader):
+    def __init__(self, executor: Optional[Executor] = None):
+        self._executor = executor or Executor()
+
     async def read(self, file_path: str) -> str:
         try:
-            reader = pypdf.PdfReader(file_path)
-            text = [page.extract_text() for page in reader.pages]
-            return "\n\n".join(text)
+            return await self._executor.run(extract_text, file_path)
         except Exception as e:
             raise ReaderError(f"Failed to read text from PDF: {e}")
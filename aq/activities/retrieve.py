@@ -22,11 +22,10 @@ class RetrieveActivity(BaseActivity):
                 raise ActivityError("A memory repository is required for this activity")
 
             memory_def = app.memory[activity.memory[0]]
-            memory_repository = self._memory_manager.get_repository(memory_def.type)
 
             n_results = activity.parameters.get("n_results", 3)
 
-            chunks = memory_repository.retrieve(memory_def, app.info.id, self.merge_inputs(inputs), n_results)
+            chunks = await self._memory_manager.retrieve(memory_def, app.info.id, self.merge_inputs(inputs), n_results)
 
             activity_job.state = JobState.SUCCESS
             activity_job.output = "\n\n".join(chunks)
@@ -23,13 +23,12 @@ class StoreActivity(BaseActivity):
                 raise ActivityError("A memory repository is required for this activity")
 
             memory_def = app.memory[activity.memory[0]]
-            memory_repository = self._memory_manager.get_repository(memory_def.type)
 
             file_id = activity_job.app_job.context.get("file_path", str(uuid.uuid4()))
             chunk_size = activity.parameters.get("chunk_size", memory_def.parameters.get("chunk_size", 2000))
 
             text = self.merge_inputs(inputs)
-            chunks = memory_repository.store(memory_def, app.info.id, file_id, text, chunk_size)
+            chunks = await self._memory_manager.store(memory_def, app.info.id, file_id, text, chunk_size)
 
             activity_job.state = JobState.SUCCESS
             activity_job.output = str(chunks)
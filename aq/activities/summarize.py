@@ -1,9 +1,9 @@
 import logging
 import time
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 from .activity import BaseActivity, ActivityError
-from ..types import ModelProvider, ActivityJob, JobState
+from ..types import Activity, Model, ModelProvider, ActivityJob, JobState
 from ..providers import ProviderManager
 from ..providers.types import ChatCompletionMessage, ChatCompletionRequest, Choice
 
@@ -14,9 +14,16 @@ class SummarizeActivity(BaseActivity):
         self._provider_manager = provider_manager
 
     async def perform(self, activity_job: ActivityJob, inputs: Dict[str, str]) -> None:
+        await self.perform_choices([activity_job], inputs)
+
+    def supports_choices(self, activity: Activity) -> bool:
+        return True
+
+    async def perform_choices(self, activity_jobs: List[ActivityJob], inputs: Dict[str, Any]) -> None:
+        # With several jobs, a single request returns a summary for each of them
         try:
-            app = activity_job.app_job.app
-            activity = app.activities[activity_job.activity_name]
+            app = activity_jobs[0].app_job.app
+            activity = app.activities[activity_jobs[0].activity_name]
 
             # Get the text for summarization
             text = self.merge_inputs(inputs)
@@ -32,21 +39,29 @@ class SummarizeActivity(BaseActivity):
             sentences = int(activity.parameters.get("sentences", model.parameters.get("sentences", 10)))
             temperature = float(activity.parameters.get("temperature", model.parameters.get("temperature", 0.5)))
 
-            summary = await self.summarize(app.info.profile, text, model.provider,
-                                           model.model, sentences, temperature)
+            summaries = await self.summarize(app.info.profile, text, model.provider,
+                                             model.model, sentences, temperature,
+                                             self.get_alternatives(app, activity), self.is_hedged(activity),
+                                             self.get_hedge_delay(activity), len(activity_jobs))
+            if len(summaries) < len(activity_jobs):
+                raise ActivityError(f"Expected {len(activity_jobs)} summaries, got {len(summaries)}")
 
-            activity_job.output = summary
-            activity_job.state = JobState.SUCCESS
-            activity_job.output_type = "text/markdown"
+            for activity_job, summary in zip(activity_jobs, summaries):
+                activity_job.output = summary
+                activity_job.state = JobState.SUCCESS
+                activity_job.output_type = "text/markdown"
 
         except Exception as e:
-            activity_job.state = JobState.ERROR
-            activity_job.output = str(e)
+            for activity_job in activity_jobs:
+                activity_job.state = JobState.ERROR
+                activity_job.output = str(e)
             self._logger.error(f"Encountered an error {e}")
 
     async def summarize(self, context: str, text: str,
                         provider_type: ModelProvider, model: str,
-                        sentences: int, temperature: float) -> str:
+                        sentences: int, temperature: float,
+                        alternatives: Optional[List[Model]] = None, hedge: bool = False,
+                        hedge_delay: Optional[float] = None, n: int = 1) -> List[str]:
         messages = []
         if context:
             messages.append(ChatCompletionMessage(role="system", content=context))
@@ -63,17 +78,18 @@ class SummarizeActivity(BaseActivity):
         request = ChatCompletionRequest(
             model=model,
             messages=messages,
-            temperature=temperature
+            temperature=temperature,
+            n=n if n > 1 else None
         )
-        provider = self._provider_manager.get_provider(provider_type)
 
         start_time = time.perf_counter()
 
-        response = await provider.create_completion(request)
-        choice: Choice = response.choices[0]
-        message: ChatCompletionMessage = choice.message
+        response = await self._provider_manager.create_completion(provider_type, request, alternatives,
+                                                                  hedge, hedge_delay)
+        choices = sorted(response.choices, key=lambda choice: choice.index)
+        choice: Choice = choices[0]
 
         self._logger.debug(f"Finished with reason {choice.finish_reason} "
                            f"in {int(time.perf_counter()-start_time)} sec.")
 
-        return message.content
+        return [choice.message.content for choice in choices]
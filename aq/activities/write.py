@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 from typing import Dict, Any
@@ -49,9 +50,14 @@ class WriteActivity(MergeActivity):
             if not os.path.exists(path):
                 os.makedirs(path)
 
+            # Structured values are serialized only when they leave the broker
+            content = activity_job.output
+            if not isinstance(content, str):
+                content = json.dumps(content, indent=2)
+
             file_path = os.path.join(path, file_name)
             async with aiofiles.open(file_path, mode='w', encoding='utf-8') as file:
-                await file.write(activity_job.output)
+                await file.write(content)
 
             activity_job.state = JobState.SUCCESS
             activity_job.output = file_path
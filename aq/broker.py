@@ -1,42 +1,156 @@
+import asyncio
 import logging
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Iterable, Optional, Tuple
 
 import yaml
 
+from .executor import Executor
+from .http_client import AsyncHttpClient
 from .jobs import JobManager, JobScheduler
-from .types import App
+from .jobs.manager import AppJobError
+from .metrics import MetricsRegistry
+from .tracing import Tracer, to_span_id, to_trace_id
+from .types import App, AppJob, JobState
 
 
 class SemanticBroker:
-    def __init__(self, job_manager: JobManager, job_scheduler: JobScheduler):
+    def __init__(self, job_manager: JobManager, job_scheduler: JobScheduler,
+                 metrics: Optional[MetricsRegistry] = None, tracer: Optional[Tracer] = None,
+                 http_client: Optional[AsyncHttpClient] = None, executor: Optional[Executor] = None):
         self._job_manager = job_manager
         self._job_scheduler = job_scheduler
+        self._http_client = http_client
+        self._executor = executor
+        self._metrics = metrics or MetricsRegistry()
+        self._tracer = tracer or Tracer()
         self._logger = logging.getLogger(self.__class__.__name__)
 
-    async def run(self, app_file: str, activity_name: str, file_path: str = None, inputs: Dict[str, Any] = None) -> Dict[str, List[str]]:
+    async def run(self, app_file: str, activity_name: str, file_path: str = None, inputs: Dict[str, Any] = None) -> Dict[str, List[Any]]:
+        app = self.load_app(app_file)
+
+        # Launch this job with the file as an input and wait only for its own work
+        await self._job_scheduler.start_workers()
+        app_job = await self.start_app_job(app, activity_name, file_path, inputs)
+
+        return await self.wait_for_outputs(app_job)
+
+    async def run_many(self, app_file: str, activity_name: str, inputs_iterable: Iterable[str | Dict[str, Any]],
+                       max_in_flight: int = 10) -> AsyncIterator[Tuple[str | Dict[str, Any], Dict[str, List[Any]]]]:
+        # Each input is either a file path or a dictionary of job inputs
+        app = self.load_app(app_file)
+        inputs_iterator = iter(inputs_iterable)
+
+        await self._job_scheduler.start_workers()
+        in_flight: Dict[asyncio.Task, str | Dict[str, Any]] = {}
+        try:
+            while True:
+                while len(in_flight) < max(max_in_flight, 1):
+                    job_input = next(inputs_iterator, None)
+                    if job_input is None:
+                        break
+                    if isinstance(job_input, dict):
+                        app_job = await self.start_app_job(app, activity_name, inputs=job_input)
+                    else:
+                        app_job = await self.start_app_job(app, activity_name, file_path=job_input)
+                    in_flight[asyncio.create_task(self.wait_for_outputs(app_job))] = job_input
+
+                if not in_flight:
+                    break
+
+                done, _ = await asyncio.wait(in_flight.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield in_flight.pop(task), task.result()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def start(self) -> None:
+        await self._job_scheduler.start_workers()
+
+    async def stop(self) -> None:
+        await self._job_scheduler.join()
+        self._tracer.flush()
+        # Open connections are closed, and the next request opens new ones
+        if self._http_client:
+            await self._http_client.close()
+        # The worker pools are shut down too, and started again by the next run
+        if self._executor:
+            self._executor.shutdown()
+
+    async def wait(self, app_job: AppJob) -> None:
+        await self._job_scheduler.wait(app_job)
+        if not app_job.finished:
+            app_job.state = JobState.SUCCESS
+            self._job_manager.save_app_job(app_job)
+        # Failed app jobs are kept and evicted like the others
+        self._job_manager.finish_app_job(app_job)
+        self._tracer.close_span(app_job.id, {
+            "aq.state": app_job.state.name,
+            "aq.prompt_tokens": app_job.usage.prompt_tokens,
+            "aq.completion_tokens": app_job.usage.completion_tokens
+        }, error="The app job failed" if app_job.state == JobState.ERROR else None)
+
+    async def wait_for_outputs(self, app_job: AppJob) -> Dict[str, List[Any]]:
+        # Outputs are collected right away, before the retention policy can evict the app job
+        await self.wait(app_job)
+        summary = self.get_summary(app_job)
+        if summary["errors"] or summary["skipped"]:
+            self._logger.warning(f"App job {app_job.id} finished with errors in {list(summary['errors'].keys())}, "
+                                 f"skipped jobs {summary['skipped']}")
+        return self.get_outputs(app_job)
+
+    async def resume(self, app_job_id: str) -> Dict[str, List[Any]]:
+        # Re-run the jobs of a stored app job that did not finish
+        await self._job_scheduler.start_workers()
+        app_job = await self._job_scheduler.resume(app_job_id)
+        self.open_span(app_job)
+        return await self.wait_for_outputs(app_job)
+
+    def get_stats(self) -> Dict[str, int]:
+        return self._job_manager.get_stats()
+
+    def get_metrics(self) -> str:
+        # The runtime metrics in the Prometheus text format
+        return self._metrics.render()
+
+    def get_summary(self, app_job: AppJob) -> Dict[str, Any]:
+        return self._job_manager.get_summary(app_job)
+
+    def get_app_job(self, app_job_id: str) -> AppJob | None:
+        return self._job_manager.app_jobs.get(app_job_id, None)
+
+    def load_app(self, app_file: str) -> App:
         # Load the app definition
         with open(app_file) as def_file:
             app_def = yaml.safe_load(def_file)
         app = App(**app_def)
         self._logger.info(f"Loaded {app_file}")
+        return app
 
-        # Create an activity job
+    async def start_app_job(self, app: App, activity_name: str, file_path: str = None, inputs: Dict[str, Any] = None) -> AppJob:
+        # Create an activity job, checking its name first so that a bad request leaves no app job behind
+        if activity_name not in app.activities:
+            raise AppJobError(f"Activity {activity_name} not found")
         app_job = self._job_manager.create_app_job(app)
         activity_job = self._job_manager.create_activity_job(app_job, activity_name)
+        app_job.state = JobState.RUNNING
+        self.open_span(app_job)
+        self._logger.info(f"Started app job {app_job.id}")
 
         # Format job inputs
         job_inputs = {"file_path": file_path} if file_path else inputs
 
-        # Launch this job with the file as an input
-        await self._job_scheduler.start_workers()
         await self._job_scheduler.schedule(activity_job, job_inputs)
-        await self._job_scheduler.join()
+        return app_job
+
+    def open_span(self, app_job: AppJob) -> None:
+        # The root span of the trace of an app job, which is the parent of the spans of its activity jobs
+        self._tracer.open_span(app_job.id, app_job.app.info.id, to_trace_id(app_job.id), to_span_id(app_job.id),
+                               attributes={"aq.app_job_id": app_job.id, "aq.app": app_job.app.info.id})
 
+    def get_outputs(self, app_job: AppJob) -> Dict[str, List[Any]]:
         usage = app_job.usage
         self._logger.debug(f"prompt_tokens={usage.prompt_tokens}, completion_tokens={usage.completion_tokens}")
 
         return self._job_manager.get_outputs(app_job)
-
-
-
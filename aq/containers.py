@@ -6,6 +6,7 @@ from dependency_injector import containers, providers
 from dotenv import load_dotenv, find_dotenv
 
 from .broker import SemanticBroker
+from .service import BrokerService
 from .activities import (
     ReadActivity,
     WriteActivity,
@@ -18,17 +19,21 @@ from .activities import (
     ReturnActivity,
     MergeActivity
 )
-from .jobs import JobManager, JobScheduler
+from .jobs import JobManager, JobScheduler, JobStore
+from .jobs.sqlite import SqliteJobStore
 from .activities.readers import PdfReader, FileReader, ImageReader, YamlReader
 from .providers import OpenAIProvider, AzureProvider, AnthropicProvider, LlavaProvider, GeminiProvider
-from .http_client import AsyncHttpClient
+from .http_client import AsyncHttpClient, CassetteHttpClient, RetryPolicy
 from .providers import ProviderManager
 from .tools.web import WebTool
 from .tools.rest import RestTool
 from .tools.news import NewsTool
-from .tools import ToolManager
+from .tools import ToolManager, ToolCache
 from .memory import MemoryManager
 from .memory.chromadb import ChromaDbRepository
+from .executor import Executor
+from .metrics import MetricsRegistry
+from .tracing import Tracer
 
 
 class Container(containers.DeclarativeContainer):
@@ -41,14 +46,43 @@ class Container(containers.DeclarativeContainer):
         format=config.log.format,
     )
 
-    http_client = providers.Singleton(
-        AsyncHttpClient
+    metrics = providers.Singleton(MetricsRegistry)
+
+    executor = providers.Singleton(
+        Executor,
+        config=config.executor,
+        metrics=metrics
+    )
+
+    tracer = providers.Singleton(
+        Tracer,
+        config=config.tracing
+    )
+
+    retry_policy = providers.Singleton(RetryPolicy, config=config.http.retry)
+
+    cassette_http_client = providers.Singleton(
+        CassetteHttpClient,
+        config=config.http.cassette,
+        metrics=metrics,
+        pool=config.http.pool,
+        retry_policy=retry_policy
+    )
+
+    http_client = providers.Selector(
+        providers.Callable(lambda mode: mode or "off", config.http.cassette.mode),
+        off=providers.Singleton(AsyncHttpClient, config=config.http.pool, metrics=metrics,
+                                retry_policy=retry_policy),
+        record=cassette_http_client,
+        replay=cassette_http_client
     )
 
     openai_provider = providers.Singleton(
         OpenAIProvider,
         config=config.providers.openai,
-        http_client=http_client
+        http_client=http_client,
+        metrics=metrics,
+        executor=executor
     )
 
     azure_provider = providers.Singleton(
@@ -81,13 +115,17 @@ class Container(containers.DeclarativeContainer):
         azure_provider=azure_provider,
         anthropic_provider=anthropic_provider,
         llava_provider=llava_provider,
-        gemini_provider=gemini_provider
+        gemini_provider=gemini_provider,
+        metrics=metrics,
+        tracer=tracer,
+        config=config.routing
     )
 
     web_tool = providers.Singleton(
         WebTool,
         config=config.tools.web,
-        http_client=http_client
+        http_client=http_client,
+        executor=executor
     )
 
     news_tool = providers.Singleton(
@@ -101,14 +139,23 @@ class Container(containers.DeclarativeContainer):
         http_client=http_client
     )
 
+    tool_cache = providers.Singleton(
+        ToolCache,
+        config=config.tools.cache,
+        metrics=metrics
+    )
+
     tool_manager = providers.Singleton(
         ToolManager,
         web_tool=web_tool,
         rest_tool=rest_tool,
-        news_tool=news_tool
+        news_tool=news_tool,
+        metrics=metrics,
+        tracer=tracer,
+        cache=tool_cache
     )
 
-    pdf_reader = providers.Singleton(PdfReader)
+    pdf_reader = providers.Singleton(PdfReader, executor=executor)
     file_reader = providers.Singleton(FileReader)
     image_reader = providers.Singleton(ImageReader)
     yaml_reader = providers.Singleton(YamlReader)
@@ -127,7 +174,9 @@ class Container(containers.DeclarativeContainer):
 
     memory_manager = providers.Singleton(
         MemoryManager,
-        chromadb_repository=chromadb_repository
+        chromadb_repository=chromadb_repository,
+        tracer=tracer,
+        executor=executor
     )
 
     store_activity = providers.Singleton(
@@ -140,7 +189,7 @@ class Container(containers.DeclarativeContainer):
         memory_manager=memory_manager
     )
 
-    merge_activity = providers.Singleton(MergeActivity)
+    merge_activity = providers.Singleton(MergeActivity, executor=executor)
     write_activity = providers.Singleton(WriteActivity)
 
     summarize_activity = providers.Singleton(
@@ -163,7 +212,17 @@ class Container(containers.DeclarativeContainer):
 
     return_activity = providers.Singleton(ReturnActivity)
 
-    job_manager = providers.Singleton(JobManager)
+    job_store = providers.Selector(
+        providers.Callable(lambda store: store or "none", config.jobs.store),
+        none=providers.Singleton(JobStore),
+        sqlite=providers.Singleton(SqliteJobStore, config=config.jobs)
+    )
+
+    job_manager = providers.Singleton(
+        JobManager,
+        config=config.jobs.retention,
+        job_store=job_store
+    )
 
     job_scheduler = providers.Singleton(
         JobScheduler,
@@ -178,17 +237,30 @@ class Container(containers.DeclarativeContainer):
         retrieve_activity=retrieve_activity,
         function_activity=function_activity,
         return_activity=return_activity,
-        merge_activity=merge_activity
+        merge_activity=merge_activity,
+        metrics=metrics,
+        tracer=tracer
     )
 
     broker = providers.Singleton(
         SemanticBroker,
         job_manager=job_manager,
-        job_scheduler=job_scheduler
+        job_scheduler=job_scheduler,
+        metrics=metrics,
+        tracer=tracer,
+        http_client=http_client,
+        executor=executor
     )
 
 
-def get_broker() -> SemanticBroker:
+    broker_service = providers.Singleton(
+        BrokerService,
+        config=config.service,
+        broker=broker
+    )
+
+
+def create_container() -> Container:
     root = os.path.dirname(find_dotenv())
     load_dotenv()
 
@@ -197,6 +269,14 @@ def get_broker() -> SemanticBroker:
     container.init_resources()
     container.wire(modules=[__name__])
 
-    return container.broker()
+    return container
+
+
+def get_broker() -> SemanticBroker:
+    return create_container().broker()
+
+
+def get_service() -> BrokerService:
+    return create_container().broker_service()
 
 
@@ -0,0 +1,6 @@
+from .executor import Executor, ExecutorError
+
+__all__ = [
+    "Executor",
+    "ExecutorError"
+]
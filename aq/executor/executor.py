@@ -0,0 +1,75 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from ..metrics import MetricsRegistry
+
+
+class ExecutorError(Exception):
+    pass
+
+
+class Executor:
+    TYPE_THREAD = "thread"
+    TYPE_PROCESS = "process"
+    TYPE_NONE = "none"
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, metrics: Optional[MetricsRegistry] = None):
+        config = config or {}
+        self._type = config.get("type", None) or self.TYPE_THREAD
+        self._workers = int(config.get("workers", None) or 0) or None
+        self._pool: Optional[concurrent.futures.Executor] = None
+        self._threads: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        if self._type not in (self.TYPE_THREAD, self.TYPE_PROCESS, self.TYPE_NONE):
+            raise ExecutorError(f"Unknown executor type {self._type}")
+
+        metrics = metrics or MetricsRegistry()
+        self._duration = metrics.histogram("aq_executor_task_seconds",
+                                           "Time to run a task in the executor, including the wait for a worker",
+                                           ["pool", "function"])
+
+    @property
+    def type(self) -> str:
+        return self._type
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        # CPU-bound work, like extracting text, parsing pages, splitting text and counting tokens, is run here
+        # so that it does not hold up the event loop. It runs in a process when the executor is configured
+        # with processes, so the function and its arguments must be picklable: pass module-level functions only.
+        if self._type == self.TYPE_PROCESS:
+            if not self._pool:
+                self._pool = concurrent.futures.ProcessPoolExecutor(self._workers)
+            return await self.submit(self._pool, self.TYPE_PROCESS, functools.partial(func, *args, **kwargs), func)
+        return await self.run_blocking(func, *args, **kwargs)
+
+    async def run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        # Work that needs objects of this process, like a database client, always runs in a thread.
+        # The context is copied, so spans started by the function have the right parent.
+        if self._type == self.TYPE_NONE:
+            return func(*args, **kwargs)
+        if not self._threads:
+            self._threads = concurrent.futures.ThreadPoolExecutor(self._workers, thread_name_prefix="aq")
+        context = contextvars.copy_context()
+        return await self.submit(self._threads, self.TYPE_THREAD,
+                                 functools.partial(context.run, func, *args, **kwargs), func)
+
+    async def submit(self, pool: concurrent.futures.Executor, pool_type: str, call: Callable, func: Callable) -> Any:
+        start_time = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, call)
+        finally:
+            self._duration.observe(time.perf_counter() - start_time, pool=pool_type,
+                                   function=getattr(func, "__qualname__", str(func)))
+
+    def shutdown(self) -> None:
+        for pool in (self._pool, self._threads):
+            if pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._threads = None
@@ -1,5 +1,13 @@
 from .async_http_client import AsyncHttpClient
+from .cassette import CassetteHttpClient, CassetteError
+from .retry import RetryPolicy, CircuitBreaker, HttpError, CircuitOpenError
 
 __all__ = [
-    "AsyncHttpClient"
+    "AsyncHttpClient",
+    "CassetteHttpClient",
+    "CassetteError",
+    "RetryPolicy",
+    "CircuitBreaker",
+    "HttpError",
+    "CircuitOpenError"
 ]
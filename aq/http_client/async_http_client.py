@@ -1,52 +1,184 @@
 import asyncio
+import copy
+import importlib.util
 import logging
-from typing import Any, Dict
-from urllib.parse import urlencode
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
 
 import httpx
 
+from .retry import HttpError, RetryPolicy
+from ..metrics import MetricsRegistry
+from ..tracing import get_current_span
+
 
 class AsyncHttpClient:
     TIMEOUT = 240
+    MAX_CONNECTIONS = 100
+    MAX_KEEPALIVE_CONNECTIONS = 20
+    KEEPALIVE_EXPIRY = 30
 
-    def __init__(self):
+    def __init__(self, config: Optional[Dict[str, Any]] = None, metrics: Optional[MetricsRegistry] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
         logging.getLogger('httpcore').setLevel(logging.ERROR)
         logging.getLogger('httpx').setLevel(logging.ERROR)
         self._logger = logging.getLogger(self.__class__.__name__)
 
+        config = config or {}
+        self._timeout = float(config.get("timeout", None) or self.TIMEOUT)
+        self._limits = httpx.Limits(
+            max_connections=int(config.get("max_connections", None) or self.MAX_CONNECTIONS),
+            max_keepalive_connections=int(config.get("max_keepalive_connections", None)
+                                          or self.MAX_KEEPALIVE_CONNECTIONS),
+            keepalive_expiry=float(config.get("keepalive_expiry", None) or self.KEEPALIVE_EXPIRY)
+        )
+        self._http2 = config.get("http2", None) is not False
+        if self._http2 and importlib.util.find_spec("h2") is None:
+            self._logger.warning("HTTP/2 needs the h2 package, falling back to HTTP/1.1")
+            self._http2 = False
+
+        # One client per host, so that each host has its own pool of connections that are kept alive between requests
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Identical GET requests made at the same time share one request
+        self._coalesce_gets = config.get("coalesce_gets", None) is not False
+        self._gets_in_flight: Dict[Tuple, asyncio.Task] = {}
+        self._retry_policy = retry_policy or RetryPolicy()
+
+        metrics = metrics or MetricsRegistry()
+        self._latency = metrics.histogram("aq_http_request_seconds", "Latency of HTTP requests", ["host", "method"])
+        self._rate_limited = metrics.counter("aq_http_rate_limited_total", "HTTP requests rejected with a 429 error",
+                                             ["host"])
+        self._retries = metrics.counter("aq_http_retries_total", "HTTP requests retried, by the reason of the retry",
+                                        ["host", "reason"])
+        self._coalesced = metrics.counter("aq_http_coalesced_total",
+                                          "GET requests served by an identical request in flight", ["host"])
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        # Connections cannot be shared between event loops, so a new loop starts with new clients
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._clients = {}
+            self._loop = loop
+
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        client = self._clients.get(host, None)
+        if client is None:
+            # Responses compressed with gzip and deflate, and brotli if it is installed, are decoded by httpx
+            client = httpx.AsyncClient(limits=self._limits, http2=self._http2, timeout=self._timeout)
+            self._clients[host] = client
+        return client
+
+    async def close(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
     async def post(self, url: str, headers: Dict[str, Any], data: Any, json=True) -> Any:
-        retry_count = 0
-        while retry_count < 5:
-            try:
-                async with httpx.AsyncClient() as ac:
-                    response = await ac.post(url, headers=headers, data=data, timeout=self.TIMEOUT)
-                if json:
-                    json_response = response.json()
-                    if "error" in json_response and "code" in json_response["error"]:
-                        if "code" in json_response["error"] and json_response["error"]["code"] == 429:
-                            self._logger.error("Received a 429 error. Retrying ...")
-                            retry_count += 1
-                            await asyncio.sleep(5*(2**retry_count))
-                        else:
-                            return json_response
-                    else:
-                        return json_response
-                else:
-                    return response.text
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 429:
-                    self._logger.error("Received a 429 error. Retrying ...")
-                    retry_count += 1
-                    await asyncio.sleep(5*(2**retry_count))
-                else:
-                    self._logger.error(f"HTTP error: {e.response.status_code}, {e.response.text}")
-                    raise e
+        return await self.request("POST", url, headers, data, json)
 
     async def get(self, url: str, query: Dict[str, Any] = None, headers: [str, Any] = None, json=True) -> Any:
         get_url = f"{url}?{urlencode(query)}" if query else url
-        async with httpx.AsyncClient() as ac:
-            response = await ac.get(get_url, headers=headers or {}, timeout=self.TIMEOUT)
-        return response.json() if json else response.text
+        if not self._coalesce_gets:
+            return await self.request("GET", get_url, headers or {}, None, json)
+
+        # The headers are part of the key, since credentials and content negotiation can change the response
+        key = (get_url, json, tuple(sorted((str(name).lower(), str(value)) for name, value in (headers or {}).items())))
+        task = self._gets_in_flight.get(key, None)
+        joined = task is not None and task.get_loop() is asyncio.get_running_loop()
+        if joined:
+            self._coalesced.inc(host=urlsplit(url).netloc)
+        else:
+            task = asyncio.create_task(self.request("GET", get_url, headers or {}, None, json))
+            self._gets_in_flight[key] = task
+            task.add_done_callback(lambda done: self.finish_get(key, done))
+
+        # A caller that is cancelled does not cancel the request for the others,
+        # and each caller that joined gets its own copy of the response to change as it likes
+        response = await asyncio.shield(task)
+        return copy.deepcopy(response) if joined else response
+
+    def finish_get(self, key: Tuple, task: asyncio.Task) -> None:
+        if self._gets_in_flight.get(key, None) is task:
+            del self._gets_in_flight[key]
+        # The error is raised to the callers, if any are left
+        if not task.cancelled():
+            task.exception()
+
+    async def request(self, method: str, url: str, headers: Dict[str, Any], data: Any, json=True) -> Any:
+        # Rate limits, server errors, timeouts and connection errors are retried, and a host that keeps failing
+        # gets its requests failed right away by its circuit breaker until it recovers
+        host = urlsplit(url).netloc
+        breaker = self._retry_policy.get_breaker(host)
+        attempt = 0
+        while True:
+            breaker.check()
+            start_time = time.perf_counter()
+            try:
+                response = await self.get_client(url).request(method, url, headers=headers, content=data)
+            except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+                breaker.record_failure()
+                reason = "timeout" if isinstance(e, httpx.TimeoutException) else "connection"
+                error = HttpError(None, f"{method} {url} failed: {reason} error {e!r}")
+                delay = self._retry_policy.get_delay(attempt)
+            else:
+                self._latency.observe(time.perf_counter() - start_time, host=host, method=method)
+                content = self.parse(response, json)
+                status = response.status_code
+                if isinstance(content, dict) and isinstance(content.get("error", None), dict) \
+                        and str(content["error"].get("code", None)) == "429":
+                    # Some APIs report rate limits in the body of the response
+                    status = 429
+
+                if not self._retry_policy.is_retryable(status):
+                    breaker.record_success()
+                    if content is None:
+                        raise HttpError(status, f"{method} {url} returned a response that is not JSON, "
+                                                f"status {status}: {response.text[:200]}")
+                    # Other errors are returned as they are, for the caller to report
+                    return content
+
+                # A rate limited host is up, so only other errors count against its circuit breaker
+                if status == 429:
+                    breaker.record_success()
+                    self._rate_limited.inc(host=host)
+                else:
+                    breaker.record_failure()
+                reason = str(status)
+                error = HttpError(status, f"{method} {url} failed with status {status}: {response.text[:200]}")
+                delay = self._retry_policy.get_delay(attempt, response.headers, rate_limited=status == 429)
+                if delay is None:
+                    self._logger.error(f"{error} The server asked for a longer wait than the retry policy allows.")
+                    raise error
+
+            attempt += 1
+            if attempt >= self._retry_policy.max_attempts:
+                self._logger.error(f"{error} Giving up after {attempt} attempts.")
+                raise error
+            self._logger.warning(f"Received a {reason} error from {host}. Retrying in {delay:.1f} sec. ...")
+            self._retries.inc(host=host, reason=reason)
+            self.record_retry()
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def parse(response: httpx.Response, json: bool) -> Any:
+        if not json:
+            return response.text
+        try:
+            return response.json()
+        except ValueError:
+            # Error pages of proxies and gateways are often HTML, even for JSON APIs
+            return None
+
+    @staticmethod
+    def record_retry() -> None:
+        # Retries are counted on the span of the call that made the request
+        span = get_current_span()
+        if span:
+            span.increment("http.retries")
 
     @staticmethod
     def urljoin(*args):
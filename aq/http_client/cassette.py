@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .async_http_client import AsyncHttpClient
+from .retry import RetryPolicy
+from ..metrics import MetricsRegistry
+
+CassetteKey = Tuple[str, str, str]
+
+
+class CassetteError(Exception):
+    pass
+
+
+class CassetteHttpClient(AsyncHttpClient):
+    MODE_RECORD = "record"
+    MODE_REPLAY = "replay"
+
+    # Query parameters that carry credentials are never written to a cassette
+    SECRET_PARAMETERS = {"key", "apikey", "api_key", "api-key", "token", "access_token", "cx"}
+
+    # Content that changes from run to run, such as the date in the system prompt of generate activities,
+    # is masked before a request body is hashed, so that a cassette replays on any day
+    VOLATILE_PATTERNS = [r"\d{4}-\d{2}-\d{2}"]
+
+    def __init__(self, config: Dict[str, Any], metrics: Optional[MetricsRegistry] = None,
+                 pool: Optional[Dict[str, Any]] = None, retry_policy: Optional[RetryPolicy] = None):
+        super().__init__(pool, metrics, retry_policy)
+        self._mode = config.get("mode", None)
+        self._path = config.get("path", None)
+        self._simulate_latency = bool(config.get("simulate_latency", False))
+        self._latency_scale = float(config.get("latency_scale", 1.0))
+        patterns: List[str] = config.get("volatile_patterns", None) or self.VOLATILE_PATTERNS
+        self._volatile_patterns = [re.compile(pattern) for pattern in patterns]
+        self._interactions: Dict[CassetteKey, Deque[Dict[str, Any]]] = {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        if self._mode not in (self.MODE_RECORD, self.MODE_REPLAY) or not self._path:
+            raise CassetteError("A cassette needs a path and a mode of record or replay")
+
+        if self._mode == self.MODE_REPLAY:
+            self.load()
+        else:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def load(self) -> None:
+        if not os.path.exists(self._path):
+            raise CassetteError(f"Cassette {self._path} not found")
+        with open(self._path, encoding="utf-8") as cassette_file:
+            for line in cassette_file:
+                if line.strip():
+                    interaction = json.loads(line)
+                    key = (interaction["method"], interaction["url"], interaction["body"])
+                    self._interactions.setdefault(key, deque()).append(interaction)
+        self._logger.info(f"Loaded {sum(len(i) for i in self._interactions.values())} interactions "
+                          f"from {self._path}")
+
+    async def post(self, url: str, headers: Dict[str, Any], data: Any, json=True) -> Any:
+        key = self.get_key("POST", url, data)
+        if self._mode == self.MODE_REPLAY:
+            return await self.replay(key)
+
+        start_time = time.perf_counter()
+        response = await super().post(url, headers, data, json)
+        self.record(key, json, time.perf_counter() - start_time, response)
+        return response
+
+    async def get(self, url: str, query: Dict[str, Any] = None, headers: [str, Any] = None, json=True) -> Any:
+        key = self.get_key("GET", f"{url}?{urlencode(query)}" if query else url, None)
+        if self._mode == self.MODE_REPLAY:
+            return await self.replay(key)
+
+        start_time = time.perf_counter()
+        response = await super().get(url, query, headers, json)
+        self.record(key, json, time.perf_counter() - start_time, response)
+        return response
+
+    def get_key(self, method: str, url: str, data: Any) -> CassetteKey:
+        return method, self.redact(url), self.hash_body(data)
+
+    async def replay(self, key: CassetteKey) -> Any:
+        # Identical requests get their responses in the order in which they were recorded
+        interactions = self._interactions.get(key, None)
+        if not interactions:
+            raise CassetteError(f"No recorded response for {key[0]} {key[1]}")
+        interaction = interactions.popleft() if len(interactions) > 1 else interactions[0]
+        if self._simulate_latency:
+            await asyncio.sleep(interaction["duration"] * self._latency_scale)
+        return interaction["response"]
+
+    def record(self, key: CassetteKey, json_response: bool, duration: float, response: Any) -> None:
+        self.save({
+            "method": key[0],
+            "url": key[1],
+            "body": key[2],
+            "json": json_response,
+            "duration": round(duration, 6),
+            "response": response
+        })
+
+    def save(self, interaction: Dict[str, Any]) -> None:
+        # Interactions are appended as they complete, so a cassette survives an interrupted run
+        with open(self._path, "a", encoding="utf-8") as cassette_file:
+            cassette_file.write(json.dumps(interaction) + "\n")
+
+    def redact(self, url: str) -> str:
+        parts = urlsplit(url)
+        if not parts.query:
+            return url
+        query = [(name, "REDACTED" if name.lower() in self.SECRET_PARAMETERS else value)
+                 for name, value in parse_qsl(parts.query, keep_blank_values=True)]
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+    def hash_body(self, data: Any) -> str:
+        if data is None:
+            return ""
+        if isinstance(data, bytes):
+            data = data.decode("utf-8", errors="replace")
+        elif not isinstance(data, str):
+            data = json.dumps(data, sort_keys=True)
+        for pattern in self._volatile_patterns:
+            data = pattern.sub("<volatile>", data)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
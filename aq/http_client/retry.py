@@ -0,0 +1,141 @@
+import logging
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+
+class HttpError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        super().__init__(message)
+
+
+class CircuitOpenError(HttpError):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(503, f"The circuit breaker of {host} is open, retry in {retry_in:.1f} sec.")
+
+
+class CircuitBreaker:
+    STATE_CLOSED = "closed"
+    STATE_OPEN = "open"
+    STATE_HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, failure_threshold: int, reset_timeout: float):
+        self.host = host
+        self.state = self.STATE_CLOSED
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def check(self) -> None:
+        # An open circuit fails requests right away. Each time the reset timeout passes,
+        # one request is let through to probe the host, and the others keep failing until a probe succeeds.
+        if self.state == self.STATE_CLOSED:
+            return
+        retry_in = self._opened_at + self._reset_timeout - time.monotonic()
+        if retry_in <= 0:
+            self.state = self.STATE_HALF_OPEN
+            self._opened_at = time.monotonic()
+            return
+        raise CircuitOpenError(self.host, max(retry_in, 0))
+
+    def record_success(self) -> None:
+        if self.state != self.STATE_CLOSED:
+            self._logger.info(f"{self.host} is back, closing the circuit")
+        self.state = self.STATE_CLOSED
+        self._failures = 0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.STATE_HALF_OPEN or \
+                (self.state == self.STATE_CLOSED and self._failures >= self._failure_threshold):
+            self._logger.warning(f"{self.host} failed {self._failures} times in a row, "
+                                 f"failing its requests for {self._reset_timeout} sec.")
+            self.state = self.STATE_OPEN
+            self._opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    DEFAULT_MAX_ATTEMPTS = 5
+    DEFAULT_BASE_DELAY = 1.0
+    DEFAULT_MAX_DELAY = 60.0
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_RESET_TIMEOUT = 30.0
+
+    RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+    # Each rate limit reset header with the header of the capacity that is left under the limit
+    RESET_HEADERS = {
+        "x-ratelimit-reset-requests": "x-ratelimit-remaining-requests",
+        "x-ratelimit-reset-tokens": "x-ratelimit-remaining-tokens",
+        "x-ratelimit-reset": "x-ratelimit-remaining"
+    }
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.max_attempts = int(config.get("max_attempts", None) or self.DEFAULT_MAX_ATTEMPTS)
+        self._base_delay = float(config.get("base_delay", None) or self.DEFAULT_BASE_DELAY)
+        self._max_delay = float(config.get("max_delay", None) or self.DEFAULT_MAX_DELAY)
+        self._failure_threshold = int(config.get("failure_threshold", None) or self.DEFAULT_FAILURE_THRESHOLD)
+        self._reset_timeout = float(config.get("reset_timeout", None) or self.DEFAULT_RESET_TIMEOUT)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._random = random.Random()
+
+    def get_breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host, None)
+        if breaker is None:
+            breaker = CircuitBreaker(host, self._failure_threshold, self._reset_timeout)
+            self._breakers[host] = breaker
+        return breaker
+
+    def is_retryable(self, status: int) -> bool:
+        return status in self.RETRY_STATUSES
+
+    def get_delay(self, attempt: int, headers: Optional[Mapping[str, str]] = None,
+                  rate_limited: bool = False) -> Optional[float]:
+        # The wait asked for by the server comes first. Otherwise the backoff is exponential with full jitter,
+        # so that workers that failed at the same time do not retry at the same time.
+        # No delay is returned when the server asks for a wait longer than max_delay, so the request is not retried
+        # and the caller can move on, to another model for example.
+        server_delay = self.get_server_delay(headers, rate_limited) if headers else None
+        if server_delay is not None:
+            if server_delay > self._max_delay:
+                return None
+            return min(server_delay + self._random.uniform(0, self._base_delay), self._max_delay)
+        return self._random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
+
+    @classmethod
+    def get_server_delay(cls, headers: Mapping[str, str], rate_limited: bool = False) -> Optional[float]:
+        retry_after = headers.get("retry-after", None)
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        if not rate_limited:
+            return None
+
+        # The rate limit headers of OpenAI tell when the request and token limits reset, as in 1s, 6m0s or 20ms.
+        # Only the limits that are used up count, if the response tells how much is left.
+        resets = [cls.parse_duration(headers[name]) for name, remaining in cls.RESET_HEADERS.items()
+                  if headers.get(name, None) and headers.get(remaining, "0").strip() == "0"]
+        resets = [reset for reset in resets if reset is not None]
+        return max(resets) if resets else None
+
+    @staticmethod
+    def parse_duration(value: str) -> Optional[float]:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+        if not parts or "".join(number + unit for number, unit in parts) != value.strip():
+            return None
+        scale = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+        return sum(float(number) * scale[unit] for number, unit in parts)
@@ -1,7 +1,10 @@
 from .manager import JobManager
 from .scheduler import JobScheduler
+from .store import JobStore, JobStoreError
 
 __all__ = [
     "JobManager",
-    "JobScheduler"
+    "JobScheduler",
+    "JobStore",
+    "JobStoreError"
 ]
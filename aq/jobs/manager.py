@@ -1,11 +1,14 @@
-import json
 import itertools
 import logging
-from typing import Dict, List, Any
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Set, Tuple
 
-from jsonpath_ng import parse
-
-from ..types import App, Activity, AppJob, ActivityJob
+from .plan import AppPlan
+from ..activities.activity import compile_jsonpath, to_text, to_value
+from .store import JobStore
+from ..types import App, Activity, ActivityType, AppJob, ActivityJob, JobState
 
 
 class AppJobError(Exception):
@@ -16,80 +19,261 @@ class JobManager:
     app_jobs: Dict[str, AppJob]
     activity_jobs: Dict[str, Dict[str, List[ActivityJob]]]
 
-    def __init__(self):
+    def __init__(self, config: Optional[Dict[str, Any]] = None, job_store: Optional[JobStore] = None):
         self.app_jobs = {}
         self.activity_jobs = {}
+        self._config = config or {}
+        self._job_store = job_store or JobStore()
+        self._callees: Dict[str, List[str]] = {}
+        self._finished: OrderedDict[str, float] = OrderedDict()
+        self._evicted = 0
+        self._plans: Dict[int, AppPlan] = {}
+        self._outstanding_jobs: Dict[str, Dict[str, int]] = {}
+        self._outstanding_inputs: Dict[str, Dict[str, int]] = {}
+        self._completed: Dict[str, Set[str]] = {}
+        self._streamed: Dict[str, Dict[str, Set[str]]] = {}
         self._logger = logging.getLogger(self.__class__.__name__)
 
-    def create_app_job(self, app: App) -> AppJob:
+    def get_plan(self, app: App) -> AppPlan:
+        key = id(app)
+        plan = self._plans.get(key, None)
+        if not plan:
+            plan = AppPlan(app)
+            self._plans[key] = plan
+            weakref.finalize(app, self._plans.pop, key, None)
+        return plan
+
+    def create_app_job(self, app: App, caller: Optional[ActivityJob] = None) -> AppJob:
         app_job = AppJob(app)
+        app_job.caller = caller
+        self.add_app_job(app_job)
+        self._job_store.save_app_job(app_job)
+        return app_job
+
+    def add_app_job(self, app_job: AppJob) -> None:
         self.app_jobs[app_job.id] = app_job
         self.activity_jobs[app_job.id] = {}
-        return app_job
+        self._outstanding_jobs[app_job.id] = {}
+        self._outstanding_inputs[app_job.id] = {}
+        self._completed[app_job.id] = set()
+        self._streamed[app_job.id] = {}
+        if app_job.caller:
+            self._callees.setdefault(app_job.root.id, []).append(app_job.id)
 
     def create_activity_job(self, app_job: AppJob, activity_name: str) -> ActivityJob:
         app = app_job.app
         if activity_name not in app.activities:
             raise AppJobError(f"Activity {activity_name} not found")
         activity_job = ActivityJob(activity_name, app_job)
-        self.activity_jobs[app_job.id].setdefault(activity_name, []).append(activity_job)
+        self.add_activity_job(activity_job)
         return activity_job
 
-    def get_next_activities(self, activity_job: ActivityJob) -> List[str]:
-        app = activity_job.app_job.app
+    def add_activity_job(self, activity_job: ActivityJob) -> None:
+        app_job = activity_job.app_job
+        activity_name = activity_job.activity_name
+        self.activity_jobs[app_job.id].setdefault(activity_name, []).append(activity_job)
+
+        outstanding_jobs = self._outstanding_jobs[app_job.id]
+        outstanding_jobs[activity_name] = outstanding_jobs.get(activity_name, 0) + 1
+
+    def save_app_job(self, app_job: AppJob) -> None:
+        self._job_store.save_app_job(app_job)
+
+    def save_activity_job(self, activity_job: ActivityJob, inputs: Optional[Dict[str, Any]] = None) -> None:
+        self._job_store.save_activity_job(activity_job, inputs)
+        if activity_job.finished:
+            self._job_store.save_app_job(activity_job.app_job)
+
+    def restore_app_job(self, app_job_id: str) -> Tuple[AppJob, List[Tuple[ActivityJob, Dict[str, Any]]],
+                                                        List[Tuple[AppJob, str]]]:
+        # Rebuild an app job with its callees from the job store and return the jobs that did not finish
+        # and the activities that are ready to run but have no jobs yet
+        apps: Dict[str, App] = {}
+        app_jobs: Dict[str, AppJob] = {}
+        callers: Dict[str, str] = {}
+        for record in self._job_store.load_app_jobs(app_job_id):
+            app = apps.get(record["app"], None)
+            if not app:
+                app = App.model_validate_json(record["app"])
+                apps[record["app"]] = app
+            app_job = AppJob(app)
+            app_job.id = record["id"]
+            app_job.context = record["context"]
+            app_job.state = JobState[record["state"]]
+            app_jobs[app_job.id] = app_job
+            if record["caller_id"]:
+                callers[record["caller_id"]] = app_job.id
+            self.add_app_job(app_job)
+
+        activity_jobs = []
+        for record in self._job_store.load_activity_jobs(list(app_jobs.keys())):
+            if record["state"] == JobState.SKIPPED.name and record["inputs"] is None:
+                # Jobs skipped because their inputs failed were never scheduled, and are skipped again on replay
+                continue
+            activity_job = ActivityJob(record["activity_name"], app_jobs[record["app_job_id"]])
+            activity_job.id = record["id"]
+            activity_job.state = JobState[record["state"]]
+            activity_job.output = record["output"] if record["output"] is not None else ""
+            activity_job.output_type = record["output_type"] or "text/plain"
+            self.add_activity_job(activity_job)
+            activity_jobs.append((activity_job, record["inputs"] or {}))
+
+        for activity_job, _ in activity_jobs:
+            callee_id = callers.get(activity_job.id, None)
+            if callee_id:
+                app_jobs[callee_id].caller = activity_job
+        self._callees[app_job_id] = [callee_id for callee_id in app_jobs if callee_id != app_job_id]
+
+        # Items of upstream jobs that finished before a streamed activity was stored are taken as dispatched
+        for app_job in app_jobs.values():
+            plan = self.get_plan(app_job.app)
+            jobs = self.activity_jobs[app_job.id]
+            for activity_name, stream_input in plan.streams.items():
+                if jobs.get(activity_name, None):
+                    self._streamed[app_job.id][activity_name] = {
+                        job.id for job in jobs.get(stream_input.activity, []) if job.state == JobState.SUCCESS
+                    }
+
+        # Replay finished jobs to restore the counters
+        unfinished = []
+        ready = []
+        for activity_job, inputs in activity_jobs:
+            if activity_job.finished:
+                app_job = activity_job.app_job
+                plan = self.get_plan(app_job.app)
+                for activity_name in self.complete_activity_job(activity_job):
+                    if not self.activity_jobs[app_job.id].get(activity_name, None) or activity_name in plan.streams:
+                        ready.append((app_job, activity_name))
+            elif activity_job.id in callers and \
+                    activity_job.app_job.app.activities[activity_job.activity_name].type == ActivityType.CALL:
+                # A call that was started is finished by the return activity of its callee
+                activity_job.state = JobState.RUNNING
+            else:
+                # Skipped jobs of a failed app job are run again as well
+                activity_job.state = JobState.CREATED
+                unfinished.append((activity_job, inputs))
+
+        root = app_jobs[app_job_id]
+        root.state = JobState.RUNNING
+        return root, unfinished, ready
+
+    def complete_activity_job(self, activity_job: ActivityJob) -> List[str]:
+        # Record a finished job and return the activities whose inputs have just become available
+        app_job = activity_job.app_job
+        outstanding_jobs = self._outstanding_jobs[app_job.id]
+        remaining = outstanding_jobs[activity_job.activity_name] - 1
+        outstanding_jobs[activity_job.activity_name] = remaining
+        if remaining > 0:
+            return []
+
+        # A streamed activity is complete only once all of its upstream activities are complete as well
+        if activity_job.activity_name in self._streamed[app_job.id] and \
+                self.is_waiting_for_jobs(app_job, activity_job.activity_name):
+            return []
+
+        return self.complete_activity(app_job, activity_job.activity_name)
+
+    def complete_activity(self, app_job: AppJob, activity_name: str) -> List[str]:
+        completed = self._completed[app_job.id]
+        if activity_name in completed:
+            return []
+        completed.add(activity_name)
+
+        plan = self.get_plan(app_job.app)
+        outstanding_inputs = self._outstanding_inputs[app_job.id]
         rv = []
-        for activity_name in app.activities:
-            activity = app.activities[activity_name]
-            for activity_input in activity.inputs or []:
-                if (activity_input.activity == activity_job.activity_name and
-                        not self.is_waiting_for_jobs(activity_job.app_job, activity)):
-                    rv.append(activity_name)
+        for next_activity in plan.downstream.get(activity_name, []):
+            waiting = outstanding_inputs.get(next_activity, len(plan.upstream[next_activity])) - 1
+            outstanding_inputs[next_activity] = waiting
+            if waiting == 0:
+                rv.append(next_activity)
         return rv
 
-    def is_waiting_for_jobs(self, app_job: AppJob, activity: Activity):
-        for activity_input in activity.inputs or []:
-            jobs = self.activity_jobs[app_job.id].get(activity_input.activity, None)
-            if not jobs or any(not job.finished for job in jobs):
-                return True
-        return False
+    def is_finished_streaming(self, app_job: AppJob, activity_name: str) -> bool:
+        # All the items of a streamed activity were dispatched and processed before its inputs completed
+        return bool(self.activity_jobs[app_job.id].get(activity_name, None)) and \
+            self._outstanding_jobs[app_job.id].get(activity_name, 0) == 0
+
+    def get_streaming_activities(self, app_job: AppJob, activity_name: str) -> List[str]:
+        # Downstream activities that can take the items of upstream jobs before the streamed input completes
+        plan = self.get_plan(app_job.app)
+        outstanding_inputs = self._outstanding_inputs[app_job.id]
+        completed = self._completed[app_job.id]
+        return [
+            next_activity
+            for next_activity in plan.downstream.get(activity_name, [])
+            if next_activity in plan.streams
+            and plan.streams[next_activity].activity not in completed
+            and outstanding_inputs.get(next_activity, len(plan.upstream[next_activity])) == 1
+        ]
+
+    def is_waiting_for_jobs(self, app_job: AppJob, activity_name: str) -> bool:
+        plan = self.get_plan(app_job.app)
+        return self._outstanding_inputs[app_job.id].get(activity_name, len(plan.upstream[activity_name])) > 0
 
-    def get_inputs_for_activity(self, app_job: AppJob, activity: Activity) -> List[Dict[str, Any]]:
+    def get_streamed_inputs_for_activity(self, app_job: AppJob, activity_name: str) -> List[Dict[str, Any]]:
+        # Take the items of the finished upstream jobs that have not been dispatched yet
+        stream_input = self.get_plan(app_job.app).streams[activity_name]
+        streamed = self._streamed[app_job.id].setdefault(activity_name, set())
+        input_jobs = [job for job in self.activity_jobs[app_job.id].get(stream_input.activity, [])
+                      if job.state == JobState.SUCCESS and job.id not in streamed]
+        if not input_jobs:
+            return []
+        streamed.update(job.id for job in input_jobs)
+        return self.get_inputs_for_activity(app_job, app_job.app.activities[activity_name],
+                                            {stream_input.activity: input_jobs})
+
+    def get_failed_inputs(self, app_job: AppJob, activity_name: str) -> List[str]:
+        # The input activities that completed without a successful job
+        jobs = self.activity_jobs[app_job.id]
+        completed = self._completed[app_job.id]
+        return [activity_input.activity for activity_input in app_job.app.activities[activity_name].inputs or []
+                if activity_input.activity in completed
+                and not any(job.state == JobState.SUCCESS for job in jobs.get(activity_input.activity, []))]
+
+    def get_inputs_for_activity(self, app_job: AppJob, activity: Activity,
+                                selected_jobs: Optional[Dict[str, List[ActivityJob]]] = None) -> List[Dict[str, Any]]:
         inputs_for_activity = {}
 
         if activity.inputs:
             for activity_input in activity.inputs:
-                input_jobs = [job for job in self.activity_jobs[app_job.id].get(activity_input.activity, [])]
+                if selected_jobs and activity_input.activity in selected_jobs:
+                    input_jobs = selected_jobs[activity_input.activity]
+                else:
+                    # The outputs of failed jobs are error messages, which are not passed on
+                    input_jobs = [job for job in self.activity_jobs[app_job.id].get(activity_input.activity, [])
+                                  if job.state == JobState.SUCCESS]
 
                 if len(input_jobs) > 0 and input_jobs[0].output_type == "application/json":
                     # reduce json inputs 
-                    json_inputs = [json.loads(job.output) for job in input_jobs]
+                    json_inputs = [to_value(job.output) for job in input_jobs]
                     if isinstance(json_inputs[0], list):
-                        inputs_for_activity[activity_input.activity] = json.dumps(list(itertools.chain(*json_inputs)))
+                        inputs_for_activity[activity_input.activity] = list(itertools.chain(*json_inputs))
                     else:
-                        inputs_for_activity[activity_input.activity] = json.dumps(json_inputs)
+                        inputs_for_activity[activity_input.activity] = json_inputs
                 else:
                     # reduce text inputs 
-                    inputs_for_activity[activity_input.activity] = "\n".join([job.output for job in input_jobs])
+                    inputs_for_activity[activity_input.activity] = "\n".join([to_text(job.output) for job in input_jobs])
 
             for activity_input in activity.inputs:
                 if activity_input.map:
                     try:
-                        expr = parse(activity_input.map)
+                        expr = compile_jsonpath(activity_input.map)
                         val = inputs_for_activity[activity_input.activity]
                         inputs = []
-                        for match in expr.find(json.loads(val)):
+                        for match in expr.find(to_value(val)):
                             if isinstance(match.value, list):
                                 batch = []
                                 for input_value in match.value:
                                     if len(batch) == activity_input.batch_size:
-                                        inputs.append({**inputs_for_activity, activity_input.activity: json.dumps(
-                                            batch if len(batch) > 1 else batch[0])})
+                                        inputs.append({**inputs_for_activity, activity_input.activity:
+                                                       batch if len(batch) > 1 else batch[0]})
                                         batch = [input_value]
                                     else:
                                         batch.append(input_value)
                                 if len(batch):
-                                    inputs.append({**inputs_for_activity, activity_input.activity: json.dumps(
-                                        batch if len(batch) > 1 else batch[0])})
+                                    inputs.append({**inputs_for_activity, activity_input.activity:
+                                                   batch if len(batch) > 1 else batch[0]})
                         return inputs
                     except Exception as e:
                         self._logger.error(f"Failed to parse a map expression {e}")
@@ -97,25 +281,96 @@ class JobManager:
 
         return [inputs_for_activity]
 
-    def get_outputs(self, app_job: AppJob) -> Dict[str, Any]:
-        app = app_job.app
+    def get_app_jobs(self, app_job: AppJob) -> List[AppJob]:
+        # The app job with the app jobs of all the functions that it called
+        root = app_job.root
+        return [root, *[self.app_jobs[callee_id] for callee_id in self._callees.get(root.id, [])
+                        if callee_id in self.app_jobs]]
 
-        # Terminal activities have inputs and do not have any other activities that take their outputs
-        terminal_activities = [
-            activity_name
-            for activity_name, activity in app.activities.items()
-            if activity.inputs and not any(
-                activity_input.activity == activity_name
-                for some_other_activity in app.activities.values()
-                for activity_input in some_other_activity.inputs or []
-            )
-        ]
+    def fail_app_job(self, app_job: AppJob) -> List[ActivityJob]:
+        # Mark the app job as failed and skip the jobs that have not finished
+        skipped = []
+        for failed_app_job in self.get_app_jobs(app_job):
+            failed_app_job.state = JobState.ERROR
+            for jobs in self.activity_jobs.get(failed_app_job.id, {}).values():
+                for activity_job in jobs:
+                    if not activity_job.finished and activity_job.state != JobState.SKIPPED:
+                        activity_job.state = JobState.SKIPPED
+                        self._job_store.save_activity_job(activity_job)
+                        skipped.append(activity_job)
+            self._job_store.save_app_job(failed_app_job)
+        return skipped
+
+    def get_summary(self, app_job: AppJob) -> Dict[str, Any]:
+        # The errors and the skipped jobs of the app job and the functions that it called
+        errors: Dict[str, List[str]] = {}
+        skipped: Dict[str, int] = {}
+        for summary_app_job in self.get_app_jobs(app_job):
+            for activity_name, jobs in self.activity_jobs.get(summary_app_job.id, {}).items():
+                for activity_job in jobs:
+                    if activity_job.state == JobState.ERROR:
+                        errors.setdefault(activity_name, []).append(to_text(activity_job.output))
+                    elif activity_job.state == JobState.SKIPPED:
+                        skipped[activity_name] = skipped.get(activity_name, 0) + 1
+        return {"errors": errors, "skipped": skipped}
+
+    def finish_app_job(self, app_job: AppJob) -> None:
+        # Apply the retention policy once the results of an app job are ready, unless it was evicted already
+        if app_job.id in self.app_jobs and app_job.id not in self._finished:
+            self._finished[app_job.id] = time.time()
+        self.evict_expired()
+
+    def evict_expired(self) -> None:
+        max_finished = int(self._config.get("max_finished", 0) or 0)
+        ttl = float(self._config.get("ttl", 0) or 0)
+        now = time.time()
+        while self._finished:
+            app_job_id, finished = next(iter(self._finished.items()))
+            if max_finished and len(self._finished) > max_finished:
+                self.evict_app_job(app_job_id)
+            elif ttl and now - finished > ttl:
+                self.evict_app_job(app_job_id)
+            else:
+                break
+
+    def evict_app_job(self, app_job_id: str) -> None:
+        # Forget an app job with the jobs of all the functions that it called
+        self._finished.pop(app_job_id, None)
+        for evicted_id in [app_job_id, *self._callees.pop(app_job_id, [])]:
+            self.app_jobs.pop(evicted_id, None)
+            self.activity_jobs.pop(evicted_id, None)
+            self._outstanding_jobs.pop(evicted_id, None)
+            self._outstanding_inputs.pop(evicted_id, None)
+            self._completed.pop(evicted_id, None)
+            self._streamed.pop(evicted_id, None)
+        self._evicted += 1
 
-        # Collect outputs from terminal activities
+    def get_stats(self) -> Dict[str, int]:
+        self.evict_expired()
+        activity_jobs = [job for jobs in self.activity_jobs.values() for activity in jobs.values() for job in activity]
+        return {
+            "app_jobs": len(self.app_jobs),
+            "finished_app_jobs": len(self._finished),
+            "evicted_app_jobs": self._evicted,
+            "activity_jobs": len(activity_jobs),
+            # Structured outputs are measured by the size of their JSON
+            "output_bytes": sum(len(to_text(job.output).encode("utf-8")) for job in activity_jobs),
+            "plans": len(self._plans)
+        }
+
+    def get_outputs(self, app_job: AppJob) -> Dict[str, List[Any]]:
+        plan = self.get_plan(app_job.app)
+
+        # Collect outputs from terminal activities, skipped jobs have none
         outputs = {
-            activity_name: [job.output for job in self.activity_jobs[app_job.id].get(activity_name, [])]
-            for activity_name in terminal_activities
+            activity_name: [job.output for job in self.activity_jobs.get(app_job.id, {}).get(activity_name, [])
+                            if job.state != JobState.SKIPPED]
+            for activity_name in plan.terminal
         }
 
+        # Evict the app job once its outputs have been delivered if the retention policy says so
+        if self._config.get("evict_on_outputs", False) and app_job.id in self._finished:
+            self.evict_app_job(app_job.id)
+
         # Remove empty values and return
         return {key: value for key, value in outputs.items() if value}
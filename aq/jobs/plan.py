@@ -0,0 +1,37 @@
+from typing import Dict, List
+
+from ..types import App, ActivityInput
+
+
+# The dependency index of an app, compiled once and shared by all of its app jobs
+class AppPlan:
+    upstream: Dict[str, List[str]]
+    downstream: Dict[str, List[str]]
+    terminal: List[str]
+    streams: Dict[str, ActivityInput]
+
+    def __init__(self, app: App):
+        self.upstream = {}
+        self.downstream = {activity_name: [] for activity_name in app.activities}
+        self.streams = {}
+
+        for activity_name, activity in app.activities.items():
+            inputs = []
+            for activity_input in activity.inputs or []:
+                if activity_input.activity not in inputs:
+                    inputs.append(activity_input.activity)
+            self.upstream[activity_name] = inputs
+
+            # Only the first map input fans out, so it is the only input that can be streamed
+            map_input = next((activity_input for activity_input in activity.inputs or [] if activity_input.map), None)
+            if map_input and map_input.stream:
+                self.streams[activity_name] = map_input
+            for input_name in inputs:
+                self.downstream.setdefault(input_name, []).append(activity_name)
+
+        # Terminal activities have inputs and do not have any other activities that take their outputs
+        self.terminal = [
+            activity_name
+            for activity_name in app.activities
+            if self.upstream[activity_name] and not self.downstream[activity_name]
+        ]
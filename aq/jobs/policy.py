@@ -0,0 +1,87 @@
+import logging
+import weakref
+from typing import Dict, Any, Tuple
+
+from .manager import JobManager
+from .plan import AppPlan
+from ..types import ActivityJob, ActivityType
+
+
+class SchedulingPolicy:
+    # Jobs with lower priority values are dequeued first
+    def priority(self, activity_job: ActivityJob) -> float:
+        return 0
+
+    def record(self, activity_job: ActivityJob, duration: float) -> None:
+        pass
+
+
+class FifoPolicy(SchedulingPolicy):
+    pass
+
+
+class CriticalPathPolicy(SchedulingPolicy):
+    SMOOTHING = 0.2
+
+    def __init__(self, job_manager: JobManager, latency_weighted: bool = False):
+        self._job_manager = job_manager
+        self._latency_weighted = latency_weighted
+        self._latencies: Dict[Tuple[str, str], float] = {}
+        self._path_lengths: weakref.WeakKeyDictionary[AppPlan, Dict[str, float]] = weakref.WeakKeyDictionary()
+
+    def priority(self, activity_job: ActivityJob) -> float:
+        plan = self._job_manager.get_plan(activity_job.app_job.app)
+        path_lengths = self._path_lengths.get(plan, None)
+        if path_lengths is None:
+            path_lengths = self.get_path_lengths(activity_job)
+            self._path_lengths[plan] = path_lengths
+        return -path_lengths.get(activity_job.activity_name, 0)
+
+    def record(self, activity_job: ActivityJob, duration: float) -> None:
+        if not self._latency_weighted:
+            return
+
+        # Keep an exponential moving average of the latency of each activity
+        app = activity_job.app_job.app
+        key = (app.info.id, activity_job.activity_name)
+        latency = self._latencies.get(key, None)
+        self._latencies[key] = duration if latency is None else latency + self.SMOOTHING * (duration - latency)
+        self._path_lengths.pop(self._job_manager.get_plan(app), None)
+
+    def get_path_lengths(self, activity_job: ActivityJob) -> Dict[str, float]:
+        # The longest remaining path from each activity to the end of the app
+        app = activity_job.app_job.app
+        plan = self._job_manager.get_plan(app)
+        path_lengths: Dict[str, float] = {}
+
+        def path_length(activity_name: str, visiting: frozenset) -> float:
+            if activity_name in path_lengths:
+                return path_lengths[activity_name]
+            if activity_name in visiting or activity_name not in app.activities:
+                return 0
+
+            activity = app.activities[activity_name]
+            visiting = visiting | {activity_name}
+            length = self._latencies.get((app.info.id, activity_name), 1.0) if self._latency_weighted else 1.0
+
+            # A call activity includes the function that it calls
+            if activity.type == ActivityType.CALL:
+                length += path_length(activity.parameters.get("function", ""), visiting)
+
+            length += max((path_length(next_activity, visiting)
+                           for next_activity in plan.downstream.get(activity_name, [])), default=0)
+            path_lengths[activity_name] = length
+            return length
+
+        for name in app.activities:
+            path_length(name, frozenset())
+        return path_lengths
+
+
+def create_policy(config: Dict[str, Any], job_manager: JobManager) -> SchedulingPolicy:
+    policy = config.get("policy", "fifo")
+    if policy == "critical_path":
+        return CriticalPathPolicy(job_manager, bool(config.get("latency_weighted", False)))
+    elif policy != "fifo":
+        logging.getLogger(__name__).error(f"Unknown scheduling policy {policy}. Using fifo.")
+    return FifoPolicy()
@@ -1,9 +1,12 @@
 import asyncio
+import heapq
+import itertools
 import logging
 import time
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Set, Tuple
 
 from .manager import JobManager, AppJobError
+from .policy import create_policy
 from ..activities import (
     ReadActivity,
     WriteActivity,
@@ -16,32 +19,121 @@ from ..activities import (
     ReturnActivity,
     MergeActivity
 )
-from ..types import ActivityType, ActivityJob, JobState
+from ..activities.activity import to_text
+from ..metrics import LoopLagMonitor, MetricsRegistry
+from ..tracing import Tracer, to_span_id, to_trace_id
+from ..types import ActivityType, ActivityJob, AppJob, JobState
 
 
 class WorkItem:
     job: ActivityJob
     inputs: Dict[str, Any]
+    priority: float
+    queued_time: float
+    siblings: List[ActivityJob]
+    completed: Set[str]
 
-    def __init__(self, job: ActivityJob, inputs: Dict[str, Any]) -> None:
+    def __init__(self, job: ActivityJob, inputs: Dict[str, Any], priority: float = 0,
+                 siblings: Optional[List[ActivityJob]] = None) -> None:
         self.job = job
         self.inputs = inputs
+        self.priority = priority
+        self.queued_time = time.perf_counter()
+        # Jobs with the same inputs whose outputs are the other choices of the same model request
+        self.siblings = siblings or []
+        # The ids of the jobs that were recorded as finished with the job manager
+        self.completed = set()
+
+    @property
+    def jobs(self) -> List[ActivityJob]:
+        return [self.job, *self.siblings]
+
+
+class PrioritySemaphore:
+    # A semaphore that wakes up the waiter with the lowest priority value first
+    def __init__(self, value: int) -> None:
+        self._value = value
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: float = 0) -> None:
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+
+class Lane:
+    name: str
+    queue: asyncio.PriorityQueue
+    semaphores: List[PrioritySemaphore]
+    dispatcher: Optional[asyncio.Task]
+
+    def __init__(self, name: str, semaphores: List[PrioritySemaphore]) -> None:
+        self.name = name
+        self.queue = asyncio.PriorityQueue()
+        self.semaphores = semaphores
+        self.dispatcher = None
 
 
 class JobScheduler:
+    DEFAULT_WORKERS = 3
+    ON_ERROR_CONTINUE = "continue"
+    ON_ERROR_FAIL_FAST = "fail_fast"
+
     def __init__(self, config: Dict[str, Any], job_manager: JobManager,
                  read_activity: ReadActivity, write_activity: WriteActivity,
                  summarize_activity: SummarizeActivity, generate_activity: GenerateActivity,
                  extract_activity: ExtractActivity, store_activity: StoreActivity, retrieve_activity: RetrieveActivity,
-                 function_activity: FunctionActivity, return_activity: ReturnActivity, merge_activity: MergeActivity):
+                 function_activity: FunctionActivity, return_activity: ReturnActivity, merge_activity: MergeActivity,
+                 metrics: Optional[MetricsRegistry] = None, tracer: Optional[Tracer] = None):
         self._config = config
+        self._tracer = tracer or Tracer()
 
         self._logger = logging.getLogger(self.__class__.__name__)
         logging.getLogger('asyncio').setLevel(logging.ERROR)
 
-        self._queue = asyncio.Queue()
-        self._workers = []
+        self._lanes: Dict[str, Lane] = {}
+        self._semaphores: Dict[str, Optional[PrioritySemaphore]] = {}
+        self._tasks: Dict[asyncio.Task, WorkItem] = {}
+        self._counter = itertools.count()
+        self._pending = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._app_job_pending: Dict[str, int] = {}
+        self._app_job_waiters: Dict[str, asyncio.Future] = {}
+        self._failed: Set[str] = set()
         self._job_manager = job_manager
+        self._policy = create_policy(config, job_manager)
+
+        metrics = metrics or MetricsRegistry()
+        metrics.gauge("aq_queue_depth", "Work items waiting in a lane", ["lane"],
+                      lambda: {(lane.name,): lane.queue.qsize() for lane in self._lanes.values()})
+        metrics.gauge("aq_jobs_in_flight", "Activity jobs being performed", ["activity_type"],
+                      self.count_in_flight)
+        self._queue_wait = metrics.histogram("aq_queue_wait_seconds",
+                                             "Time from scheduling a job to the start of its work", ["lane"])
+        self._job_duration = metrics.histogram("aq_job_duration_seconds",
+                                               "Time to perform an activity job", ["activity_type"])
+        self._jobs = metrics.counter("aq_jobs_total", "Activity jobs performed by their state at the end of the work",
+                                     ["activity_type", "state"])
+        self._lag_monitor = LoopLagMonitor(metrics)
 
         self._activity_handlers = {
             ActivityType.READ: read_activity,
@@ -57,24 +149,179 @@ class JobScheduler:
         }
 
     async def start_workers(self):
-        num_workers = self._config.get("workers", 3)
-        self._workers = [asyncio.create_task(self.consume(n)) for n in range(num_workers)]
+        # Lanes and semaphores are bound to the running event loop and shared by all runs on that loop
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._lanes = {}
+        self._semaphores = {}
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._app_job_pending = {}
+        self._app_job_waiters = {}
+        self._failed = set()
+        self._lag_monitor.start()
+
+    async def schedule(self, activity_job: ActivityJob, inputs: Dict[str, Any],
+                       siblings: Optional[List[ActivityJob]] = None) -> None:
+        item = WorkItem(activity_job, inputs, self._policy.priority(activity_job), siblings)
+        if activity_job.app_job.root.id in self._failed:
+            # The app job failed, so new work is skipped right away
+            for job in item.jobs:
+                job.state = JobState.SKIPPED
+                self._job_manager.save_activity_job(job, inputs)
+            return
+
+        for job in item.jobs:
+            self._job_manager.save_activity_job(job, inputs)
+        lane = self.get_lane(activity_job)
+        self._pending += 1
+        self._idle.clear()
+        root_id = activity_job.app_job.root.id
+        self._app_job_pending[root_id] = self._app_job_pending.get(root_id, 0) + 1
+        await lane.queue.put((item.priority, next(self._counter), item))
 
-    async def schedule(self, activity_job: ActivityJob, inputs: Dict[str, Any]) -> None:
-        item = WorkItem(activity_job, inputs)
-        await self._queue.put(item)
+    async def wait(self, app_job: AppJob) -> None:
+        # Wait until there is no more work for the app job and the functions that it called
+        root_id = app_job.root.id
+        if not self._app_job_pending.get(root_id, 0):
+            return
+        waiter = self._app_job_waiters.get(root_id, None)
+        if not waiter:
+            waiter = asyncio.get_running_loop().create_future()
+            self._app_job_waiters[root_id] = waiter
+        await asyncio.shield(waiter)
 
-    async def consume(self, name: int) -> None:
+    def get_lane(self, activity_job: ActivityJob) -> Lane:
+        app = activity_job.app_job.app
+        activity = app.activities[activity_job.activity_name]
+
+        # Jobs that call a model get a lane per model, so a slow provider never blocks the others
+        name = activity.type.value
+        semaphores = []
+        if activity.models and app.models and activity.models[0] in app.models:
+            model = app.models[activity.models[0]]
+            name = f"{name}/{model.provider.value}/{model.model}"
+            semaphores.append(self.get_semaphore("models", model.model, 0))
+            semaphores.append(self.get_semaphore("providers", model.provider.value, 0))
+        semaphores.append(self.get_semaphore("activities", activity.type.value,
+                                             self._config.get("workers", self.DEFAULT_WORKERS)))
+
+        lane = self._lanes.get(name, None)
+        if not lane:
+            lane = Lane(name, [semaphore for semaphore in semaphores if semaphore])
+            lane.dispatcher = asyncio.create_task(self.consume(lane))
+            self._lanes[name] = lane
+        return lane
+
+    def get_semaphore(self, scope: str, key: str, default: int) -> Optional[PrioritySemaphore]:
+        # A limit of zero means that the concurrency is not limited
+        name = f"{scope}/{key}"
+        if name not in self._semaphores:
+            concurrency = self._config.get("concurrency", None) or {}
+            limits = concurrency.get(scope, None) or {}
+            limit = limits.get(key, default)
+            self._semaphores[name] = PrioritySemaphore(int(limit)) if limit else None
+        return self._semaphores[name]
+
+    async def consume(self, lane: Lane) -> None:
         while True:
-            item = await self._queue.get()
-            self._logger.debug(f"Worker {name} performing {item.job.activity_name}")
+            _, _, item = await lane.queue.get()
+            acquired = []
+            try:
+                for semaphore in lane.semaphores:
+                    await semaphore.acquire(item.priority)
+                    acquired.append(semaphore)
+            except asyncio.CancelledError:
+                for semaphore in acquired:
+                    semaphore.release()
+                raise
+
+            if item.job.app_job.root.id in self._failed:
+                # The app job failed while this job was waiting for its turn
+                for semaphore in acquired:
+                    semaphore.release()
+                lane.queue.task_done()
+                self._finish_work_item(item)
+                continue
+
+            self._queue_wait.observe(time.perf_counter() - item.queued_time, lane=lane.name)
+            task = asyncio.create_task(self.run(lane, item))
+            self._tasks[task] = item
+            task.add_done_callback(lambda done: self._tasks.pop(done, None))
+
+    async def run(self, lane: Lane, item: WorkItem) -> None:
+        self._logger.debug(f"Lane {lane.name} performing {item.job.activity_name}")
+        app_job = item.job.app_job
+        with self._tracer.start_span(item.job.activity_name, trace_id=to_trace_id(app_job.root.id),
+                                     span_id=to_span_id(item.job.id),
+                                     parent_id=to_span_id(app_job.caller.id if app_job.caller else app_job.id),
+                                     attributes={"aq.activity_type": self.get_activity_type(item.job),
+                                                 "aq.app_job_id": app_job.id,
+                                                 "aq.lane": lane.name}) as span:
             start_time = time.perf_counter()
-            await self.perform(item)
-            self._logger.debug(f"Finished {item.job.activity_name} in {int(time.perf_counter()-start_time)} sec.")
-            self._queue.task_done()
+            try:
+                await self.perform(item)
+                duration = time.perf_counter() - start_time
+                self._job_duration.observe(duration, activity_type=self.get_activity_type(item.job))
+                if item.job.finished:
+                    self._policy.record(item.job, duration)
+                self._logger.debug(f"Finished {item.job.activity_name} in {int(duration)} sec.")
+            except asyncio.CancelledError:
+                for job in item.jobs:
+                    if not job.finished:
+                        job.state = JobState.SKIPPED
+                        self._job_manager.save_activity_job(job)
+                raise
+            except Exception as e:
+                self._logger.error(f"{item.job.activity_name} failed with error {e}")
+                # Jobs that raised or timed out finish like the jobs that report an error,
+                # so that the other jobs of the activity still release the next stage
+                for job in item.jobs:
+                    if job.id not in item.completed:
+                        job.state = JobState.ERROR
+                        job.output = str(e)
+                        await self.complete_failed(item, job)
+            finally:
+                for job in item.jobs:
+                    self._jobs.inc(activity_type=self.get_activity_type(job), state=job.state.name)
+                if span:
+                    span.set_attribute("aq.state", item.job.state.name)
+                    span.set_attribute("aq.prompt_tokens", item.job.usage.prompt_tokens)
+                    span.set_attribute("aq.completion_tokens", item.job.usage.completion_tokens)
+                    if item.siblings:
+                        span.set_attribute("aq.choices", len(item.jobs))
+                    if item.job.state == JobState.ERROR:
+                        span.set_error(to_text(item.job.output))
+                if any(job.state == JobState.ERROR for job in item.jobs) and \
+                        self.get_on_error(item.job) == self.ON_ERROR_FAIL_FAST:
+                    self.fail(item.job.app_job)
+                for semaphore in lane.semaphores:
+                    semaphore.release()
+                lane.queue.task_done()
+                self._finish_work_item(item)
+
+    def _finish_work_item(self, item: WorkItem) -> None:
+        root_id = item.job.app_job.root.id
+        pending = self._app_job_pending[root_id] - 1
+        if pending > 0:
+            self._app_job_pending[root_id] = pending
+        else:
+            del self._app_job_pending[root_id]
+            self._failed.discard(root_id)
+            waiter = self._app_job_waiters.pop(root_id, None)
+            if waiter and not waiter.done():
+                waiter.set_result(None)
+
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
 
     async def perform(self, item: WorkItem) -> None:
-        item.job.state = JobState.RUNNING
+        for job in item.jobs:
+            job.state = JobState.RUNNING
         app = item.job.app_job.app
         app_job = item.job.app_job
 
@@ -85,8 +332,8 @@ class JobScheduler:
             # Push a new app job on the call stack
             function_name = activity.parameters["function"]
             if function_name and function_name in app.activities:
-                app_job = self._job_manager.create_app_job(app)
-                app_job.caller = item.job
+                self._job_manager.save_activity_job(item.job)
+                app_job = self._job_manager.create_app_job(app, caller=item.job)
                 function_job = self._job_manager.create_activity_job(app_job, function_name)
                 await self.schedule(function_job, item.inputs)
             else:
@@ -94,43 +341,190 @@ class JobScheduler:
         else:
             handler = self._activity_handlers.get(activity_type)
             if handler:
-                await handler.perform(item.job, item.inputs)
-
-                app_job.usage.completion_tokens += item.job.usage.completion_tokens
-                app_job.usage.prompt_tokens += item.job.usage.prompt_tokens
-
-                if item.job.state == JobState.SUCCESS:
-                    # Pop the app job stack if it's a return activity
-                    if activity_type == ActivityType.RETURN and app_job.caller:
-                        # Update the state of the caller activity
-                        activity_job = app_job.caller
-                        activity_job.state = JobState.SUCCESS
-                        activity_job.output = item.job.output
-                        activity_job.output_type = item.job.output_type
-
-                        # Update the state of the callee app job
-                        app_job.state = JobState.SUCCESS
-                        app_job = activity_job.app_job
-                    else:
-                        activity_job = item.job
-
-                    # Schedule next jobs
-                    next_activities = self._job_manager.get_next_activities(activity_job)
-                    for next_activity in next_activities:
-                        activity = app.activities[next_activity]
-                        all_inputs = self._job_manager.get_inputs_for_activity(app_job, activity)
-                        count = activity.parameters.get("count", 1)
-                        for _ in range(count):
-                            for job_inputs in all_inputs:
-                                next_job = self._job_manager.create_activity_job(app_job, next_activity)
-                                await self.schedule(next_job, job_inputs)
+                timeout = activity.parameters.get("timeout", self._config.get("timeout", None))
+                if item.siblings:
+                    work = handler.perform_choices(item.jobs, item.inputs)
+                else:
+                    work = handler.perform(item.job, item.inputs)
+                if timeout:
+                    try:
+                        await asyncio.wait_for(work, float(timeout))
+                    except asyncio.TimeoutError:
+                        raise AppJobError(f"{item.job.activity_name} timed out after {timeout} sec.")
                 else:
-                    self._logger.error(f"{item.job.activity_name} failed with error {item.job.output}")
+                    await work
+
+                for job in item.jobs:
+                    await self.complete(app_job, job, activity_type)
+                    item.completed.add(job.id)
             else:
                 raise AppJobError(f"Unknown activity type {activity_type}")
 
+    async def complete(self, app_job: AppJob, job: ActivityJob, activity_type: ActivityType) -> None:
+        app_job.usage.completion_tokens += job.usage.completion_tokens
+        app_job.usage.prompt_tokens += job.usage.prompt_tokens
+
+        self._job_manager.save_activity_job(job)
+        completed_job = job
+        next_activities = self._job_manager.complete_activity_job(job)
+
+        if job.state == JobState.SUCCESS:
+            # Pop the app job stack if it's a return activity
+            if activity_type == ActivityType.RETURN and app_job.caller:
+                # Update the state of the caller activity
+                activity_job = app_job.caller
+                activity_job.state = JobState.SUCCESS
+                activity_job.output = job.output
+                activity_job.output_type = job.output_type
+
+                # Update the state of the callee app job
+                app_job.state = JobState.SUCCESS
+                self._job_manager.save_app_job(app_job)
+                self._job_manager.save_activity_job(activity_job)
+                app_job = activity_job.app_job
+                completed_job = activity_job
+                next_activities = self._job_manager.complete_activity_job(activity_job)
+
+        else:
+            self._logger.error(f"{job.activity_name} failed with error {job.output}")
+
+        # The last job of an activity releases the next stage, whether it succeeded or not,
+        # and the next stage is skipped if none of its jobs succeeded
+        await self.schedule_next(app_job, next_activities)
+        await self.schedule_streams(app_job, completed_job.activity_name)
+
+    async def complete_failed(self, item: WorkItem, job: ActivityJob) -> None:
+        try:
+            await self.complete(job.app_job, job, job.app_job.app.activities[job.activity_name].type)
+        except Exception as e:
+            self._logger.error(f"Failed to complete {job.activity_name}: {e}")
+            self._job_manager.save_activity_job(job)
+        item.completed.add(job.id)
+
+    @staticmethod
+    def get_activity_type(activity_job: ActivityJob) -> str:
+        return activity_job.app_job.app.activities[activity_job.activity_name].type.value
+
+    def count_in_flight(self) -> Dict[Tuple[str], int]:
+        in_flight: Dict[Tuple[str], int] = {}
+        for item in self._tasks.values():
+            key = (self.get_activity_type(item.job),)
+            in_flight[key] = in_flight.get(key, 0) + 1
+        return in_flight
+
+    def get_on_error(self, activity_job: ActivityJob) -> str:
+        activity = activity_job.app_job.app.activities[activity_job.activity_name]
+        return activity.parameters.get("on_error", self._config.get("on_error", self.ON_ERROR_CONTINUE))
+
+    def fail(self, app_job: AppJob) -> None:
+        # Skip the remaining work of an app job after one of its jobs failed
+        root = app_job.root
+        if root.id in self._failed or root.id not in self._app_job_pending:
+            return
+        self._failed.add(root.id)
+        skipped = self._job_manager.fail_app_job(root)
+        self._logger.error(f"App job {root.id} failed, skipping {len(skipped)} jobs")
+
+        # Drop the queued work items
+        for lane in self._lanes.values():
+            entries = []
+            while not lane.queue.empty():
+                entries.append(lane.queue.get_nowait())
+                lane.queue.task_done()
+            for entry in entries:
+                if entry[2].job.app_job.root.id == root.id:
+                    self._finish_work_item(entry[2])
+                else:
+                    lane.queue.put_nowait(entry)
+
+        # Cancel the work items in flight
+        current_task = asyncio.current_task()
+        for task, item in list(self._tasks.items()):
+            if task is not current_task and item.job.app_job.root.id == root.id:
+                task.cancel()
+
+    async def schedule_next(self, app_job: AppJob, next_activities: List[str]) -> None:
+        app = app_job.app
+        plan = self._job_manager.get_plan(app)
+        for next_activity in next_activities:
+            if self._job_manager.get_failed_inputs(app_job, next_activity):
+                await self.skip(app_job, next_activity)
+                continue
+            if next_activity in plan.streams:
+                all_inputs = self._job_manager.get_streamed_inputs_for_activity(app_job, next_activity)
+                if not all_inputs and self._job_manager.is_finished_streaming(app_job, next_activity):
+                    # Every item was processed while the upstream jobs were still running
+                    await self.schedule_next(app_job, self._job_manager.complete_activity(app_job, next_activity))
+                    await self.schedule_streams(app_job, next_activity)
+                    continue
+            else:
+                all_inputs = self._job_manager.get_inputs_for_activity(app_job, app.activities[next_activity])
+            await self.schedule_jobs(app_job, next_activity, all_inputs)
+
+    async def schedule_streams(self, app_job: AppJob, activity_name: str) -> None:
+        # Dispatch the items of finished upstream jobs to the streamed activities that take them
+        for next_activity in self._job_manager.get_streaming_activities(app_job, activity_name):
+            if self._job_manager.get_failed_inputs(app_job, next_activity):
+                # The activity is skipped once its streamed input completes
+                continue
+            all_inputs = self._job_manager.get_streamed_inputs_for_activity(app_job, next_activity)
+            await self.schedule_jobs(app_job, next_activity, all_inputs)
+
+    async def skip(self, app_job: AppJob, activity_name: str) -> None:
+        # An activity with an input that has no successful jobs is not run, and neither are the activities after it
+        failed_inputs = self._job_manager.get_failed_inputs(app_job, activity_name)
+        self._logger.warning(f"Skipping {activity_name}, no jobs of {', '.join(failed_inputs)} succeeded")
+        job = self._job_manager.create_activity_job(app_job, activity_name)
+        job.state = JobState.SKIPPED
+        self._job_manager.save_activity_job(job)
+        completed_job = job
+        next_activities = self._job_manager.complete_activity_job(job)
+
+        if app_job.app.activities[activity_name].type == ActivityType.RETURN and app_job.caller:
+            # The call waiting for the return activity is skipped as well
+            completed_job = app_job.caller
+            completed_job.state = JobState.SKIPPED
+            self._job_manager.save_activity_job(completed_job)
+            app_job = completed_job.app_job
+            next_activities = self._job_manager.complete_activity_job(completed_job)
+
+        await self.schedule_next(app_job, next_activities)
+        await self.schedule_streams(app_job, completed_job.activity_name)
+
+    async def schedule_jobs(self, app_job: AppJob, activity_name: str, all_inputs: List[Dict[str, Any]]) -> None:
+        activity = app_job.app.activities[activity_name]
+        count = activity.parameters.get("count", 1)
+        handler = self._activity_handlers.get(activity.type, None)
+        if count > 1 and handler and handler.supports_choices(activity):
+            # The jobs with the same inputs share one model request that returns a choice for each of them
+            for job_inputs in all_inputs:
+                jobs = [self._job_manager.create_activity_job(app_job, activity_name) for _ in range(count)]
+                await self.schedule(jobs[0], job_inputs, jobs[1:])
+            return
+
+        for _ in range(count):
+            for job_inputs in all_inputs:
+                next_job = self._job_manager.create_activity_job(app_job, activity_name)
+                await self.schedule(next_job, job_inputs)
+
+    async def resume(self, app_job_id: str) -> AppJob:
+        # Schedule the jobs of a stored app job that did not finish
+        app_job, unfinished, ready = self._job_manager.restore_app_job(app_job_id)
+        self._logger.info(f"Resuming {len(unfinished)} jobs of app job {app_job_id}")
+        for activity_job, inputs in unfinished:
+            await self.schedule(activity_job, inputs)
+        for ready_app_job, activity_name in ready:
+            await self.schedule_next(ready_app_job, [activity_name])
+        return app_job
+
     async def join(self) -> None:
-        await self._queue.join()
-        for w in self._workers:
-            w.cancel()
+        # Wait for the work of all app jobs and stop the workers, if any were started
+        if self._loop is None:
+            return
+        await self._idle.wait()
+        for lane in self._lanes.values():
+            lane.dispatcher.cancel()
+        self._lanes = {}
+        self._loop = None
+        self._lag_monitor.stop()
         self._logger.debug("Finished work items")
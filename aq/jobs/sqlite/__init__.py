@@ -0,0 +1,5 @@
+from .store import SqliteJobStore
+
+__all__ = [
+    "SqliteJobStore"
+]
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+
+from ..store import JobStore, JobStoreError
+from ...types import App, AppJob, ActivityJob
+
+
+class SqliteJobStore(JobStore):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS apps (
+            id TEXT PRIMARY KEY,
+            definition TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS app_jobs (
+            id TEXT PRIMARY KEY,
+            app_id TEXT NOT NULL,
+            root_id TEXT NOT NULL,
+            caller_id TEXT,
+            state TEXT NOT NULL,
+            context TEXT,
+            updated REAL
+        );
+        CREATE INDEX IF NOT EXISTS app_jobs_root ON app_jobs (root_id);
+        CREATE TABLE IF NOT EXISTS activity_jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT UNIQUE NOT NULL,
+            app_job_id TEXT NOT NULL,
+            activity_name TEXT NOT NULL,
+            state TEXT NOT NULL,
+            inputs TEXT,
+            output TEXT,
+            output_type TEXT,
+            updated REAL
+        );
+        CREATE INDEX IF NOT EXISTS activity_jobs_app_job ON activity_jobs (app_job_id);
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self._config = config or {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._app_ids: Dict[int, str] = {}
+
+        path = self._config.get("path", "./data/jobs.db")
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(self.SCHEMA)
+
+    def save_app_job(self, app_job: AppJob) -> None:
+        self._connection.execute("""
+            INSERT INTO app_jobs (id, app_id, root_id, caller_id, state, context, updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET state = excluded.state, context = excluded.context,
+                updated = excluded.updated
+        """, (app_job.id, self.save_app(app_job.app), app_job.root.id, app_job.caller.id if app_job.caller else None,
+              app_job.state.name, json.dumps(app_job.context), time.time()))
+
+    def save_activity_job(self, activity_job: ActivityJob, inputs: Optional[Dict[str, Any]] = None) -> None:
+        self._connection.execute("""
+            INSERT INTO activity_jobs (id, app_job_id, activity_name, state, inputs, output, output_type, updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET state = excluded.state, output = excluded.output,
+                output_type = excluded.output_type, inputs = COALESCE(excluded.inputs, inputs),
+                updated = excluded.updated
+        """, (activity_job.id, activity_job.app_job.id, activity_job.activity_name, activity_job.state.name,
+              json.dumps(inputs) if inputs is not None else None, json.dumps(activity_job.output),
+              activity_job.output_type,
+              time.time()))
+
+    def save_app(self, app: App) -> str:
+        # Apps are stored once and shared by all of their app jobs
+        key = id(app)
+        app_id = self._app_ids.get(key, None)
+        if not app_id:
+            definition = app.model_dump_json()
+            app_id = hashlib.sha256(definition.encode()).hexdigest()
+            self._connection.execute("INSERT OR IGNORE INTO apps (id, definition) VALUES (?, ?)",
+                                     (app_id, definition))
+            self._app_ids[key] = app_id
+            weakref.finalize(app, self._app_ids.pop, key, None)
+        return app_id
+
+    def load_app_jobs(self, app_job_id: str) -> List[Dict[str, Any]]:
+        cursor = self._connection.execute("""
+            SELECT app_jobs.id, app_jobs.caller_id, app_jobs.state, app_jobs.context, apps.definition
+            FROM app_jobs JOIN apps ON apps.id = app_jobs.app_id
+            WHERE app_jobs.root_id = ? ORDER BY app_jobs.rowid
+        """, (app_job_id,))
+        rows = [{
+            "id": row[0],
+            "caller_id": row[1],
+            "state": row[2],
+            "context": json.loads(row[3]) if row[3] else {},
+            "app": row[4]
+        } for row in cursor.fetchall()]
+        if not rows:
+            raise JobStoreError(f"App job {app_job_id} not found")
+        return rows
+
+    def load_activity_jobs(self, app_job_ids: List[str]) -> List[Dict[str, Any]]:
+        placeholders = ", ".join("?" for _ in app_job_ids)
+        cursor = self._connection.execute(f"""
+            SELECT id, app_job_id, activity_name, state, inputs, output, output_type
+            FROM activity_jobs WHERE app_job_id IN ({placeholders}) ORDER BY seq
+        """, app_job_ids)
+        return [{
+            "id": row[0],
+            "app_job_id": row[1],
+            "activity_name": row[2],
+            "state": row[3],
+            "inputs": json.loads(row[4]) if row[4] else None,
+            "output": json.loads(row[5]) if row[5] else None,
+            "output_type": row[6]
+        } for row in cursor.fetchall()]
@@ -0,0 +1,22 @@
+from typing import Any, Dict, List, Optional
+
+from ..types import AppJob, ActivityJob
+
+
+class JobStoreError(Exception):
+    pass
+
+
+# The default job store keeps nothing, so app jobs cannot be resumed
+class JobStore:
+    def save_app_job(self, app_job: AppJob) -> None:
+        pass
+
+    def save_activity_job(self, activity_job: ActivityJob, inputs: Optional[Dict[str, Any]] = None) -> None:
+        pass
+
+    def load_app_jobs(self, app_job_id: str) -> List[Dict[str, Any]]:
+        return []
+
+    def load_activity_jobs(self, app_job_ids: List[str]) -> List[Dict[str, Any]]:
+        return []
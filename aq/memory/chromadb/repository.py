@@ -8,7 +8,6 @@ from ...types import MemoryDef
 
 import chromadb
 from chromadb.config import Settings
-from ..splitter import split_into_chunks
 
 
 class ChromaDbRepository(MemoryRepository):
@@ -23,11 +22,10 @@ class ChromaDbRepository(MemoryRepository):
 
         self._chroma_client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
 
-    def store(self, memory_def: MemoryDef, collection: str, item_id: str, text: str, chunk_size: int) -> int:
+    def store(self, memory_def: MemoryDef, collection: str, item_id: str, chunks: List[str]) -> int:
         documents = []
         metas = []
         ids = []
-        chunks = split_into_chunks(text, chunk_size)
         for i, chunk in enumerate(chunks):
             ids.append(f"{item_id} {i}")
             documents.append(chunk)
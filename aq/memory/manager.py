@@ -1,16 +1,39 @@
 import logging
+from typing import List, Optional
 
 from .repository import MemoryRepository
 from .chromadb import ChromaDbRepository
-from ..types import MemoryType
+from .splitter import split_into_chunks
+from ..executor import Executor
+from ..tracing import Tracer
+from ..types import MemoryType, MemoryDef
 
 
 class MemoryManager:
-    def __init__(self, chromadb_repository: ChromaDbRepository):
+    def __init__(self, chromadb_repository: ChromaDbRepository, tracer: Optional[Tracer] = None,
+                 executor: Optional[Executor] = None):
         self._repositories = {
             MemoryType.CHROMADB: chromadb_repository
         }
+        self._tracer = tracer or Tracer()
+        self._executor = executor or Executor()
         self._logger = logging.getLogger(self.__class__.__name__)
 
     def get_repository(self, memory_type: MemoryType) -> MemoryRepository:
         return self._repositories[memory_type]
+
+    async def store(self, memory_def: MemoryDef, collection: str, item_id: str, text: str, chunk_size: int) -> int:
+        with self._tracer.start_span(f"{memory_def.type.value} store",
+                                     attributes={"aq.collection": collection, "aq.chunk_size": chunk_size}) as span:
+            chunks = await self._executor.run(split_into_chunks, text, chunk_size)
+            stored = await self._executor.run_blocking(self.get_repository(memory_def.type).store,
+                                                       memory_def, collection, item_id, chunks)
+            if span:
+                span.set_attribute("aq.chunks", stored)
+            return stored
+
+    async def retrieve(self, memory_def: MemoryDef, collection: str, query: str, n_results: int = 3) -> List[str]:
+        with self._tracer.start_span(f"{memory_def.type.value} retrieve",
+                                     attributes={"aq.collection": collection, "aq.n_results": n_results}):
+            return await self._executor.run_blocking(self.get_repository(memory_def.type).retrieve,
+                                                     memory_def, collection, query, n_results)
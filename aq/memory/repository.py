@@ -3,7 +3,7 @@ from ..types import MemoryDef
 
 
 class MemoryRepository:
-    def store(self, memory_def: MemoryDef, collection: str, item_id: str, text: str, chunk_size: int) -> int:
+    def store(self, memory_def: MemoryDef, collection: str, item_id: str, chunks: List[str]) -> int:
         return 0
 
     def retrieve(self, memory_def: MemoryDef, collection: str, query: str, n_results=3) -> List[str]:
@@ -0,0 +1,11 @@
+from .lag import LoopLagMonitor
+from .registry import MetricsRegistry, MetricsError, Counter, Gauge, Histogram
+
+__all__ = [
+    "MetricsRegistry",
+    "MetricsError",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "LoopLagMonitor"
+]
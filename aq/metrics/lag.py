@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from typing import Optional
+
+from .registry import MetricsRegistry
+
+
+class LoopLagMonitor:
+    INTERVAL = 0.1
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+    # Measures how late the event loop wakes up a task that sleeps for a fixed interval.
+    # Synchronous work on the loop delays every other task by the same amount.
+    def __init__(self, metrics: Optional[MetricsRegistry] = None, interval: float = INTERVAL):
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag = 0.0
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        metrics = metrics or MetricsRegistry()
+        self._lag = metrics.histogram("aq_event_loop_lag_seconds", "Delay of the event loop in waking up a task",
+                                      buckets=self.BUCKETS)
+
+    def start(self) -> None:
+        if not self._task or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.monitor())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def monitor(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start_time = loop.time()
+            await asyncio.sleep(self._interval)
+            lag = max(loop.time() - start_time - self._interval, 0.0)
+            self.max_lag = max(self.max_lag, lag)
+            self._lag.observe(lag)
@@ -0,0 +1,180 @@
+import bisect
+import math
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+
+class MetricsError(Exception):
+    pass
+
+
+class Metric:
+    type: str = "untyped"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, Any] = {}
+        self._lock = threading.Lock()
+
+    def get_label_values(self, labels: Dict[str, Any]) -> LabelValues:
+        if len(labels) != len(self.label_names):
+            raise MetricsError(f"{self.name} takes labels {', '.join(self.label_names)}")
+        try:
+            return tuple(str(labels[name]) for name in self.label_names)
+        except KeyError as e:
+            raise MetricsError(f"{self.name} does not have a value for label {e}")
+
+    def get_samples(self) -> List[Tuple[str, LabelValues, float]]:
+        with self._lock:
+            return [(self.name, label_values, value) for label_values, value in self._values.items()]
+
+    def get(self, **labels) -> Any:
+        return self._values.get(self.get_label_values(labels), None)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        label_values = self.get_label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    # A gauge with a callback reads its values when the metrics are collected
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, description, label_names)
+        self._callbacks = [callback] if callback else []
+
+    def add_callback(self, callback: Callable[[], Dict[LabelValues, float]]) -> None:
+        self._callbacks.append(callback)
+
+    def set(self, value: float, **labels) -> None:
+        label_values = self.get_label_values(labels)
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        label_values = self.get_label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def get_samples(self) -> List[Tuple[str, LabelValues, float]]:
+        samples = super().get_samples()
+        for callback in self._callbacks:
+            samples.extend((self.name, label_values, value) for label_values, value in callback().items())
+        return samples
+
+
+class Histogram(Metric):
+    type = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        label_values = self.get_label_values(labels)
+        with self._lock:
+            # The counts of each bucket, the count of values above the last bucket, and the sum
+            counts = self._values.get(label_values, None)
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1) + [0.0]
+                self._values[label_values] = counts
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def get(self, **labels) -> Optional[Dict[str, float]]:
+        counts = self._values.get(self.get_label_values(labels), None)
+        if counts is None:
+            return None
+        return {"count": sum(counts[:-1]), "sum": counts[-1]}
+
+    def get_samples(self) -> List[Tuple[str, LabelValues, float]]:
+        samples = []
+        with self._lock:
+            values = [(label_values, list(counts)) for label_values, counts in self._values.items()]
+        for label_values, counts in values:
+            total = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                total += count
+                samples.append((f"{self.name}_bucket", (*label_values, format_value(bound)), total))
+            samples.append((f"{self.name}_count", label_values, total))
+            samples.append((f"{self.name}_sum", label_values, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter, name, description, label_names)
+
+    def gauge(self, name: str, description: str, label_names: Sequence[str] = (),
+              callback: Optional[Callable[[], Dict[LabelValues, float]]] = None) -> Gauge:
+        gauge = self.register(Gauge, name, description, label_names)
+        if callback:
+            gauge.add_callback(callback)
+        return gauge
+
+    def histogram(self, name: str, description: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram, name, description, label_names, buckets=buckets)
+
+    def register(self, metric_class, name: str, description: str, label_names: Sequence[str], **kwargs) -> Any:
+        # Components that share the registry get the same metric for the same name
+        with self._lock:
+            metric = self._metrics.get(name, None)
+            if metric is None:
+                metric = metric_class(name, description, label_names, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class) or metric.label_names != tuple(label_names):
+                raise MetricsError(f"{name} is already registered with a different type or labels")
+            return metric
+
+    def get_metric(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name, None)
+
+    def render(self) -> str:
+        # The Prometheus text exposition format
+        lines = []
+        for metric in list(self._metrics.values()):
+            samples = metric.get_samples()
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for sample_name, label_values, value in samples:
+                label_names = metric.label_names + ("le",) if sample_name.endswith("_bucket") else metric.label_names
+                if label_names:
+                    labels = ",".join(f'{label_name}="{escape(label_value)}"'
+                                      for label_name, label_value in zip(label_names, label_values))
+                    lines.append(f"{sample_name}{{{labels}}} {format_value(value)}")
+                else:
+                    lines.append(f"{sample_name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -1,20 +1,36 @@
+import asyncio
 import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 from .anthropic import AnthropicProvider
 from .azure import AzureProvider
 from .gemini import GeminiProvider
 from .llava import LlavaProvider
 from .openai import OpenAIProvider
-from .provider import BaseProvider
-from ..types import ModelProvider
+from .provider import BaseProvider, ProviderError
+from .router import ModelRouter
+from .types import ChatCompletionRequest, ChatCompletionResponse, Usage
+from ..metrics import MetricsRegistry
+from ..tracing import Span, Tracer
+from ..types import Model, ModelProvider
 
 
 class ProviderManager:
+    DEFAULT_HEDGE_DELAY = 10
+    HEDGE_PERCENTILE = 0.95
+    HEDGE_MIN_SAMPLES = 20
+
+    # Providers that return several choices for one request
+    CHOICES_PROVIDERS = {ModelProvider.OPENAI, ModelProvider.AZURE}
+
     def __init__(self, openai_provider: OpenAIProvider,
                  azure_provider: AzureProvider,
                  anthropic_provider: AnthropicProvider,
                  llava_provider: LlavaProvider,
-                 gemini_provider: GeminiProvider):
+                 gemini_provider: GeminiProvider,
+                 metrics: Optional[MetricsRegistry] = None, tracer: Optional[Tracer] = None,
+                 config: Optional[Dict[str, Any]] = None):
         self._providers = {
             ModelProvider.OPENAI: openai_provider,
             ModelProvider.AZURE: azure_provider,
@@ -23,7 +39,153 @@ class ProviderManager:
             ModelProvider.LLAVA: llava_provider
         }
         self._logger = logging.getLogger(self.__class__.__name__)
+        self._tracer = tracer or Tracer()
+        self._router = ModelRouter(config)
+
+        metrics = metrics or MetricsRegistry()
+        self._latency = metrics.histogram("aq_provider_request_seconds", "Latency of model completion requests",
+                                          ["provider", "model"])
+        self._errors = metrics.counter("aq_provider_errors_total", "Failed model completion requests",
+                                       ["provider", "model", "code"])
+        self._tokens = metrics.counter("aq_provider_tokens_total", "Tokens used by model completion requests",
+                                       ["provider", "model", "type"])
+        self._hedged = metrics.counter("aq_provider_hedged_total",
+                                       "Requests sent to another model when the first one was slow or failed",
+                                       ["provider", "model", "result"])
+        self._failovers = metrics.counter("aq_provider_failovers_total",
+                                          "Requests sent to another model after the previous one failed",
+                                          ["provider", "model"])
+        metrics.gauge("aq_provider_healthy", "Whether requests are routed to a model", ["provider", "model"],
+                      self._router.get_status)
 
     def get_provider(self, provider_type: ModelProvider) -> BaseProvider:
         return self._providers[provider_type]
 
+    async def create_completion(self, provider_type: ModelProvider, request: ChatCompletionRequest,
+                                alternatives: Optional[List[Model]] = None, hedge: bool = False,
+                                hedge_delay: Optional[float] = None) -> ChatCompletionResponse:
+        # The alternatives are the other models of the activity. The router orders the models by their health
+        # and latency, and a request that fails with a retryable error moves on to the next model.
+        # With hedging, a request that takes longer than the usual latency of its model is sent to the next model too.
+        if not alternatives:
+            return await self.complete(provider_type, request)
+
+        models = self._router.route([Model(model=request.model, provider=provider_type), *alternatives])
+        candidates = [(model.provider, request if model.model == request.model
+                       else request.model_copy(update={"model": model.model})) for model in models]
+        if hedge:
+            return await self.create_hedged_completion(candidates, hedge_delay)
+        return await self.create_failover_completion(candidates)
+
+    async def create_failover_completion(self, candidates: List[Tuple[ModelProvider, ChatCompletionRequest]]) \
+            -> ChatCompletionResponse:
+        for n, (candidate_type, candidate_request) in enumerate(candidates):
+            if n > 0:
+                self._failovers.inc(provider=candidate_type.value, model=candidate_request.model)
+            try:
+                return await self.complete(candidate_type, candidate_request)
+            except Exception as e:
+                # A bad request fails on every model, so it is not sent to the others
+                if n == len(candidates) - 1 or not self._router.is_retryable(e):
+                    raise
+                self._logger.warning(f"{candidate_type.value} {candidate_request.model} failed: {e}. "
+                                     f"Trying {candidates[n + 1][0].value} {candidates[n + 1][1].model}")
+
+    async def create_hedged_completion(self, candidates: List[Tuple[ModelProvider, ChatCompletionRequest]],
+                                       hedge_delay: Optional[float] = None) -> ChatCompletionResponse:
+        # The first response wins and the other requests are cancelled. When every request in flight fails,
+        # the next model is tried right away, and the last error is raised only if all of them fail.
+        # A bad request is raised right away.
+        candidates = list(candidates)
+        primary_request = candidates[0][1]
+        tasks: Dict[asyncio.Task, Tuple[ModelProvider, str, bool]] = {}
+        error: Optional[BaseException] = None
+
+        def start(candidate_type: ModelProvider, candidate_request: ChatCompletionRequest) -> None:
+            hedge = candidate_request is not primary_request
+            if hedge:
+                self._hedged.inc(provider=candidate_type.value, model=candidate_request.model, result="sent")
+            tasks[asyncio.create_task(self.complete(candidate_type, candidate_request))] = \
+                (candidate_type, candidate_request.model, hedge)
+
+        start(*candidates.pop(0))
+        try:
+            while True:
+                if not tasks:
+                    if not candidates:
+                        raise error
+                    start(*candidates.pop(0))
+
+                last_type, last_model, _ = list(tasks.values())[-1]
+                timeout = self.get_hedge_delay(last_type, last_model, hedge_delay) if candidates else None
+                done, _ = await asyncio.wait(tasks.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The request has taken longer than the latency budget, so the next model gets it too
+                    start(*candidates.pop(0))
+                    continue
+
+                for task in done:
+                    done_type, done_model, hedge = tasks.pop(task)
+                    if task.exception() is None:
+                        if hedge:
+                            self._hedged.inc(provider=done_type.value, model=done_model, result="won")
+                        return task.result()
+                    error = task.exception()
+                    if not self._router.is_retryable(error):
+                        raise error
+                    self._logger.warning(f"{done_type.value} {done_model} failed: {error}")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def get_hedge_delay(self, provider_type: ModelProvider, model: str, default: Optional[float] = None) -> float:
+        # The latency budget of a model is its p95 latency, once there are enough samples
+        latency = self._router.get_percentile(provider_type, model, self.HEDGE_PERCENTILE, self.HEDGE_MIN_SAMPLES)
+        if latency is not None:
+            return latency
+        return default if default is not None else self.DEFAULT_HEDGE_DELAY
+
+    async def complete(self, provider_type: ModelProvider, request: ChatCompletionRequest) -> ChatCompletionResponse:
+        if request.n and request.n > 1 and provider_type not in self.CHOICES_PROVIDERS:
+            # Other providers get a request for each choice
+            single_request = request.model_copy(update={"n": None})
+            responses = await asyncio.gather(*(self.complete(provider_type, single_request) for _ in range(request.n)))
+            return self.merge_choices(responses)
+
+        provider = self.get_provider(provider_type)
+        labels = {"provider": provider_type.value, "model": request.model}
+
+        with self._tracer.start_span(f"{provider_type.value} {request.model}", kind=Span.KIND_CLIENT,
+                                     attributes={"gen_ai.system": provider_type.value,
+                                                 "gen_ai.request.model": request.model}) as span:
+            start_time = time.perf_counter()
+            try:
+                response = await provider.create_completion(request)
+            except ProviderError as e:
+                self._errors.inc(code=e.code, **labels)
+                self._router.record(provider_type, request.model, time.perf_counter() - start_time, e)
+                raise
+            except Exception as e:
+                self._errors.inc(code=getattr(e, "code", None) or "", **labels)
+                self._router.record(provider_type, request.model, time.perf_counter() - start_time, e)
+                raise
+            latency = time.perf_counter() - start_time
+            self._latency.observe(latency, **labels)
+            self._router.record(provider_type, request.model, latency)
+
+            if response.usage:
+                self._tokens.inc(response.usage.prompt_tokens, type="prompt", **labels)
+                self._tokens.inc(response.usage.completion_tokens, type="completion", **labels)
+                if span:
+                    span.set_attribute("gen_ai.usage.input_tokens", response.usage.prompt_tokens)
+                    span.set_attribute("gen_ai.usage.output_tokens", response.usage.completion_tokens)
+            return response
+
+    @staticmethod
+    def merge_choices(responses: List[ChatCompletionResponse]) -> ChatCompletionResponse:
+        choices = [choice.model_copy(update={"index": index})
+                   for index, choice in enumerate(choice for response in responses for choice in response.choices)]
+        usage = Usage(prompt_tokens=sum(response.usage.prompt_tokens for response in responses),
+                      completion_tokens=sum(response.usage.completion_tokens for response in responses),
+                      total_tokens=sum(response.usage.total_tokens for response in responses))
+        return responses[0].model_copy(update={"choices": choices, "usage": usage})
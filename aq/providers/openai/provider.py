@@ -2,13 +2,20 @@ import logging
 import time
 import tiktoken
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from ..provider import BaseProvider, ProviderError
+from ...executor import Executor
 from ...http_client import AsyncHttpClient
+from ...metrics import MetricsRegistry
+from ...tracing import get_current_span
 from ..types import ChatCompletionRequest, ChatCompletionResponse, Error
 
 
+def count_tokens(text: str) -> int:
+    return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+
 class ModelLimits:
     def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, max_tokens: int = 128000):
         self.requests_per_minute = requests_per_minute
@@ -41,12 +48,22 @@ class ModelLimits:
 
 class OpenAIProvider(BaseProvider):
 
-    def __init__(self, config: Dict[str, Any], http_client: AsyncHttpClient):
+    def __init__(self, config: Dict[str, Any], http_client: AsyncHttpClient, metrics: Optional[MetricsRegistry] = None,
+                 executor: Optional[Executor] = None):
         self._config = config
         self._http_client = http_client
+        self._executor = executor or Executor()
         self._logger = logging.getLogger(self.__class__.__name__)
-        self._encoding = tiktoken.get_encoding("cl100k_base")
-        self._limits = ModelLimits(requests_per_minute=5000, tokens_per_minute=160000, max_tokens=128000)
+        limits = config or {}
+        self._limits = ModelLimits(requests_per_minute=limits.get("requests_per_minute", 5000),
+                                   tokens_per_minute=limits.get("tokens_per_minute", 160000),
+                                   max_tokens=128000)
+
+        metrics = metrics or MetricsRegistry()
+        metrics.gauge("aq_model_limits_capacity", "Request and token capacity left under the model rate limits",
+                      ["provider", "type"], self.get_capacity)
+        self._throttled = metrics.counter("aq_model_limits_throttled_total",
+                                          "Requests delayed for lack of rate limit capacity", ["provider"])
 
     @staticmethod
     def _check_config(config: Dict[str, Any]) -> None:
@@ -58,7 +75,7 @@ class OpenAIProvider(BaseProvider):
         self._check_config(self._config)
 
         attempts = 360
-        tokens = self.estimate_tokens(request)        
+        tokens = await self.estimate_tokens(request)
         while attempts > 0:
             if self._limits.consume(tokens):
                 headers = {
@@ -80,15 +97,26 @@ class OpenAIProvider(BaseProvider):
                 
                 attempts -= 1
                 sleep_time = 10
+                self._throttled.inc(provider="openai")
+                span = get_current_span()
+                if span:
+                    span.increment("aq.throttled")
                 self._logger.debug(f"Insufficient token or request capacity. Sleeping {sleep_time} seconds")
                 self._logger.debug(f"Estimated tokens: {tokens}. "
                                    f"Available tokens: {self._limits.available_token_capacity}")
                 await asyncio.sleep(sleep_time)
 
-    def estimate_tokens(self, request: ChatCompletionRequest) -> int:
+    def get_capacity(self) -> Dict[tuple, float]:
+        self._limits.update_capacity()
+        return {
+            ("openai", "requests"): self._limits.available_request_capacity,
+            ("openai", "tokens"): self._limits.available_token_capacity
+        }
+
+    async def estimate_tokens(self, request: ChatCompletionRequest) -> int:
         text_list = [message.content for message in request.messages if isinstance(message.content, str)]
         text_list.extend(content.text for message in request.messages if isinstance(message.content, list)
                          for content in message.content if content.type == "text")
         text = "\n".join(text_list)
-        num_tokens = len(self._encoding.encode(text))
+        num_tokens = await self._executor.run(count_tokens, text)
         return num_tokens + 4096
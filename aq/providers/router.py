@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from ..http_client import HttpError
+from ..types import Model, ModelProvider
+
+ModelKey = Tuple[ModelProvider, str]
+
+
+class ModelHealth:
+    def __init__(self, window: int):
+        # The latency of each recent request, and whether it failed
+        self.outcomes: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.cooldown_until = 0.0
+
+    def get_latencies(self) -> List[float]:
+        return [latency for latency, failed in self.outcomes if not failed]
+
+    def get_mean_latency(self) -> Optional[float]:
+        latencies = self.get_latencies()
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def get_error_rate(self) -> float:
+        return sum(1 for _, failed in self.outcomes if failed) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class ModelRouter:
+    DEFAULT_WINDOW = 100
+    DEFAULT_COOLDOWN = 30
+    DEFAULT_MAX_ERROR_RATE = 0.5
+    DEFAULT_LATENCY_FACTOR = 2.0
+    MIN_SAMPLES = 5
+
+    # The errors that another model, or a later request, can get past. Others are caused by the request itself.
+    RETRY_CODES = {"408", "429", "rate_limit_exceeded", "server_error"}
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.enabled = config.get("enabled", None) is not False
+        self._window = int(config.get("window", None) or self.DEFAULT_WINDOW)
+        self._cooldown = float(config.get("cooldown", None) or self.DEFAULT_COOLDOWN)
+        self._max_error_rate = float(config.get("max_error_rate", None) or self.DEFAULT_MAX_ERROR_RATE)
+        self._latency_factor = float(config.get("latency_factor", None) or self.DEFAULT_LATENCY_FACTOR)
+        self._health: Dict[ModelKey, ModelHealth] = {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def get_health(self, key: ModelKey) -> ModelHealth:
+        health = self._health.get(key, None)
+        if health is None:
+            health = ModelHealth(self._window)
+            self._health[key] = health
+        return health
+
+    @classmethod
+    def is_retryable(cls, error: BaseException) -> bool:
+        if isinstance(error, (asyncio.TimeoutError, httpx.TransportError, ConnectionError)):
+            return True
+        # HTTP errors have no status code for timeouts and connection errors
+        if isinstance(error, HttpError) and error.code is None:
+            return True
+        # Provider and HTTP errors carry the status code of the response
+        code = str(getattr(error, "code", None))
+        return code in cls.RETRY_CODES or code.isdigit() and int(code) >= 500
+
+    def record(self, provider_type: ModelProvider, model: str, latency: float,
+               error: Optional[BaseException] = None) -> None:
+        # A bad request fails on any model, so it says nothing about the health of this one
+        if error is not None and not self.is_retryable(error):
+            return
+
+        health = self.get_health((provider_type, model))
+        rate_limited = str(getattr(error, "code", None)) == "429"
+        health.outcomes.append((latency, error is not None))
+
+        # A model that is rate limited or fails too often is avoided for a while
+        if rate_limited or (len(health.outcomes) >= self.MIN_SAMPLES
+                            and health.get_error_rate() > self._max_error_rate):
+            if not self.is_cooling_down(health):
+                self._logger.warning(f"{provider_type.value} {model} is unhealthy, "
+                                     f"{'rate limited' if rate_limited else 'failing'}. "
+                                     f"Routing around it for {self._cooldown} sec.")
+            health.cooldown_until = time.monotonic() + self._cooldown
+            # The errors that caused the cooldown do not count against the model after it
+            health.outcomes = deque(((latency, failed) for latency, failed in health.outcomes if not failed),
+                                    maxlen=self._window)
+
+    def is_healthy(self, provider_type: ModelProvider, model: str) -> bool:
+        health = self._health.get((provider_type, model), None)
+        return health is None or not self.is_cooling_down(health)
+
+    @staticmethod
+    def is_cooling_down(health: ModelHealth) -> bool:
+        return health.cooldown_until > time.monotonic()
+
+    def route(self, models: List[Model]) -> List[Model]:
+        # The models in the order to try them. Healthy models come first, in the order of the app,
+        # but a model much slower than the fastest healthy one gives way to the models after it.
+        if not self.enabled or len(models) < 2:
+            return list(models)
+
+        healthy = [model for model in models if self.is_healthy(model.provider, model.model)]
+        unhealthy = sorted((model for model in models if model not in healthy),
+                           key=lambda model: self.get_health((model.provider, model.model)).cooldown_until)
+
+        latencies = {id(model): self.get_health((model.provider, model.model)).get_mean_latency()
+                     for model in healthy}
+        known = [latency for latency in latencies.values() if latency is not None]
+        if known:
+            budget = min(known) * self._latency_factor
+            fast = [model for model in healthy if latencies[id(model)] is None or latencies[id(model)] <= budget]
+            healthy = fast + [model for model in healthy if model not in fast]
+
+        return healthy + unhealthy
+
+    def get_percentile(self, provider_type: ModelProvider, model: str, percentile: float,
+                       min_samples: int) -> Optional[float]:
+        health = self._health.get((provider_type, model), None)
+        latencies = sorted(health.get_latencies()) if health else []
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(int(percentile * len(latencies)), len(latencies) - 1)]
+
+    def get_status(self) -> Dict[Tuple[str, str], float]:
+        return {(provider_type.value, model): 0.0 if self.is_cooling_down(health) else 1.0
+                for (provider_type, model), health in self._health.items()}
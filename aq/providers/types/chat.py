@@ -65,6 +65,7 @@ class ChatCompletionRequest(BaseModel):
     presence_penalty: float = 0.0
     frequency_penalty: float = 0.0
     max_tokens: int = 1000
+    n: Optional[int] = None
 
 
 class Choice(BaseModel):
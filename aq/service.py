@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, Set, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+import yaml
+
+from .broker import SemanticBroker
+from .jobs.manager import AppJobError
+from .types import App, AppJob
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str):
+        self.status = status
+        super().__init__(message)
+
+
+class BrokerService:
+    REASONS = {
+        200: "OK",
+        202: "Accepted",
+        400: "Bad Request",
+        404: "Not Found",
+        405: "Method Not Allowed",
+        500: "Internal Server Error"
+    }
+
+    def __init__(self, config: Dict[str, Any], broker: SemanticBroker):
+        self._config = config or {}
+        self._broker = broker
+        self._apps: Dict[str, Tuple[float, App]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    async def serve(self) -> None:
+        await self._broker.start()
+
+        socket_path = self._config.get("socket", None)
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle, path=socket_path)
+            self._logger.info(f"Listening on {socket_path}")
+        else:
+            host = self._config.get("host", "127.0.0.1")
+            port = int(self._config.get("port", 8700))
+            server = await asyncio.start_server(self.handle, host=host, port=port)
+            self._logger.info(f"Listening on http://{host}:{port}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self._broker.stop()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            method, target, body = await self.read_request(reader)
+            status, response = await self.dispatch(method, target, body)
+        except ServiceError as e:
+            status, response = e.status, {"error": str(e)}
+        except Exception as e:
+            self._logger.error(f"Failed to process a request: {e}")
+            status, response = 500, {"error": str(e)}
+
+        # Metrics are served as text and everything else as JSON
+        if isinstance(response, str):
+            content_type = "text/plain; version=0.0.4"
+            content = response.encode()
+        else:
+            content_type = "application/json"
+            content = json.dumps(response).encode()
+        writer.write(f"HTTP/1.1 {status} {self.REASONS.get(status, '')}\r\n"
+                     f"Content-Type: {content_type}\r\n"
+                     f"Content-Length: {len(content)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + content)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+        request_line = (await reader.readline()).decode().strip()
+        parts = request_line.split(" ")
+        if len(parts) < 2:
+            raise ServiceError(400, "Invalid request line")
+
+        content_length = 0
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                content_length = int(value.strip())
+
+        body = await reader.readexactly(content_length) if content_length else b""
+        return parts[0].upper(), parts[1], body
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, Dict[str, Any] | str]:
+        url = urlsplit(target)
+        path = [step for step in url.path.split("/") if step]
+        query = parse_qs(url.query)
+
+        if path == ["stats"]:
+            if method != "GET":
+                raise ServiceError(405, f"{method} is not supported")
+            return 200, self._broker.get_stats()
+        elif path == ["metrics"]:
+            if method != "GET":
+                raise ServiceError(405, f"{method} is not supported")
+            return 200, self._broker.get_metrics()
+        elif path == ["jobs"]:
+            if method != "POST":
+                raise ServiceError(405, f"{method} is not supported")
+            return 202, await self.submit(self.parse_body(body))
+        elif len(path) == 2 and path[0] == "jobs":
+            if method != "GET":
+                raise ServiceError(405, f"{method} is not supported")
+            app_job = self._broker.get_app_job(path[1])
+            if not app_job:
+                raise ServiceError(404, f"Job {path[1]} not found")
+            if query.get("wait", ["false"])[0].lower() in ("1", "true", "yes"):
+                await self._broker.wait(app_job)
+            return 200, self.get_status(app_job)
+        else:
+            raise ServiceError(404, f"{url.path} not found")
+
+    @staticmethod
+    def parse_body(body: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise ServiceError(400, f"The body is not valid JSON: {e}")
+        if not isinstance(request, dict):
+            raise ServiceError(400, "The body must be a JSON object")
+        return request
+
+    async def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        app_file = request.get("app_file", None)
+        activity_name = request.get("activity_name", None)
+        if not app_file or not activity_name:
+            raise ServiceError(400, "The app_file and activity_name properties are required")
+
+        try:
+            app = self.get_app(app_file)
+            app_job = await self._broker.start_app_job(app, activity_name,
+                                                       request.get("file_path", None), request.get("inputs", None))
+        except (OSError, ValueError, yaml.YAMLError, AppJobError) as e:
+            raise ServiceError(400, str(e))
+
+        task = asyncio.create_task(self._broker.wait(app_job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return self.get_status(app_job)
+
+    def get_app(self, app_file: str) -> App:
+        # Reuse the parsed app definition until the file changes
+        path = os.path.abspath(app_file)
+        modified = os.path.getmtime(path)
+        cached = self._apps.get(path, None)
+        if cached and cached[0] == modified:
+            return cached[1]
+        app = self._broker.load_app(path)
+        self._apps[path] = (modified, app)
+        return app
+
+    def get_status(self, app_job: AppJob) -> Dict[str, Any]:
+        status = {
+            "id": app_job.id,
+            "state": app_job.state.name,
+            "usage": {
+                "prompt_tokens": app_job.usage.prompt_tokens,
+                "completion_tokens": app_job.usage.completion_tokens
+            }
+        }
+        if app_job.finished:
+            status.update(self._broker.get_summary(app_job))
+            status["outputs"] = self._broker.get_outputs(app_job)
+        return status
@@ -1,5 +1,7 @@
 from .manager import ToolManager
+from .cache import ToolCache
 
 __all__ = [
-    "ToolManager"
+    "ToolManager",
+    "ToolCache"
 ]
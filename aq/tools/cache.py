@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from ..metrics import MetricsRegistry
+from ..types import ToolDef
+
+
+class ToolCache:
+    STORE_MEMORY = "memory"
+    STORE_SQLITE = "sqlite"
+
+    DEFAULT_TTL = 3600
+    DEFAULT_MAX_ENTRIES = 1000
+
+    # The parameters of a tool that set how it is cached rather than what it returns
+    CACHE_PARAMETERS = {"cache_ttl"}
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tool_results (
+            key TEXT PRIMARY KEY,
+            tool TEXT NOT NULL,
+            result TEXT NOT NULL,
+            expires REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tool_results_expires ON tool_results (expires);
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, metrics: Optional[MetricsRegistry] = None):
+        config = config or {}
+        self._enabled = config.get("enabled", None) is not False
+        self._ttl = float(config.get("ttl", self.DEFAULT_TTL) or 0)
+        self._max_entries = int(config.get("max_entries", None) or self.DEFAULT_MAX_ENTRIES)
+        self._entries: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        store = config.get("store", None) or self.STORE_MEMORY
+        if self._enabled and store == self.STORE_SQLITE:
+            path = config.get("path", None) or "./data/tools.db"
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._connection = sqlite3.connect(path, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(self.SCHEMA)
+            self._connection.execute("DELETE FROM tool_results WHERE expires <= ?", (time.time(),))
+
+        metrics = metrics or MetricsRegistry()
+        self._lookups = metrics.counter("aq_tool_cache_total", "Lookups of tool results in the cache",
+                                        ["tool", "function", "result"])
+        metrics.gauge("aq_tool_cache_entries", "Tool results held in memory", callback=self.get_size)
+
+    def get_ttl(self, tool_def: ToolDef) -> float:
+        # The cache_ttl parameter of a tool overrides the default, and 0 turns off caching for the tool
+        if not self._enabled:
+            return 0
+        return float(tool_def.parameters.get("cache_ttl", self._ttl) or 0)
+
+    def get_key(self, tool_def: ToolDef, function_name: str, arguments: Dict[str, Any]) -> str:
+        # Tools of the same type can differ by their parameters, such as the endpoint of a REST tool
+        parameters = {name: value for name, value in tool_def.parameters.items() if name not in self.CACHE_PARAMETERS}
+        key = [tool_def.type.value, parameters, function_name, self.normalize(arguments)]
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def normalize(cls, value: Any) -> Any:
+        # Models often repeat a query with different spacing
+        if isinstance(value, str):
+            return " ".join(value.split())
+        if isinstance(value, dict):
+            return {name: cls.normalize(item) for name, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [cls.normalize(item) for item in value]
+        return value
+
+    def get(self, tool_def: ToolDef, function_name: str, arguments: Dict[str, Any]) -> Optional[str]:
+        if self.get_ttl(tool_def) <= 0:
+            return None
+
+        key = self.get_key(tool_def, function_name, arguments)
+        now = time.time()
+        result = None
+        entry = self._entries.get(key, None)
+        if entry:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                result = entry[1]
+            else:
+                del self._entries[key]
+
+        if result is None and self._connection:
+            row = self._connection.execute("SELECT result, expires FROM tool_results WHERE key = ? AND expires > ?",
+                                           (key, now)).fetchone()
+            if row:
+                result = row[0]
+                self.put_entry(key, row[1], result)
+
+        self._lookups.inc(tool=tool_def.type.value, function=function_name,
+                          result="miss" if result is None else "hit")
+        return result
+
+    def put(self, tool_def: ToolDef, function_name: str, arguments: Dict[str, Any], result: str) -> None:
+        ttl = self.get_ttl(tool_def)
+        if ttl <= 0 or not isinstance(result, str):
+            return
+
+        key = self.get_key(tool_def, function_name, arguments)
+        expires = time.time() + ttl
+        self.put_entry(key, expires, result)
+        if self._connection:
+            self._connection.execute("""
+                INSERT INTO tool_results (key, tool, result, expires) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET result = excluded.result, expires = excluded.expires
+            """, (key, tool_def.type.value, result, expires))
+
+    def put_entry(self, key: str, expires: float, result: str) -> None:
+        # The least recently used results are dropped first
+        self._entries[key] = (expires, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def get_size(self) -> Dict[tuple, float]:
+        return {(): len(self._entries)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = misses = 0
+        for name, labels, value in self._lookups.get_samples():
+            if labels[-1] == "hit":
+                hits += value
+            else:
+                misses += value
+        return {
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": len(self._entries)
+        }
@@ -1,17 +1,61 @@
+import time
+from typing import Any, Dict, Optional
+
 from .web import WebTool
 from .rest import RestTool
 from .news import NewsTool
-from .tool import BaseTool
-from ..types import ToolType
+from .cache import ToolCache
+from .tool import BaseTool, ToolError
+from ..metrics import MetricsRegistry
+from ..tracing import Span, Tracer
+from ..types import ToolType, ToolDef
 
 
 class ToolManager:
-    def __init__(self, web_tool: WebTool, rest_tool: RestTool, news_tool: NewsTool):
+    def __init__(self, web_tool: WebTool, rest_tool: RestTool, news_tool: NewsTool,
+                 metrics: Optional[MetricsRegistry] = None, tracer: Optional[Tracer] = None,
+                 cache: Optional[ToolCache] = None):
         self._tools = {
             ToolType.WEB: web_tool,
             ToolType.REST: rest_tool,
             ToolType.NEWS: news_tool
         }
 
+        self._tracer = tracer or Tracer()
+
+        metrics = metrics or MetricsRegistry()
+        self._cache = cache or ToolCache(metrics=metrics)
+        self._latency = metrics.histogram("aq_tool_call_seconds", "Latency of tool calls", ["tool", "function"])
+        self._errors = metrics.counter("aq_tool_errors_total", "Failed tool calls", ["tool", "function"])
+
     def get_tool(self, tool_type: ToolType) -> BaseTool:
         return self._tools.get(tool_type, None)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        return self._cache.get_stats()
+
+    async def invoke(self, tool_def: ToolDef, function_name: str, arguments: Dict[str, Any]) -> str:
+        tool_obj = self.get_tool(tool_def.type)
+        if not tool_obj:
+            raise ToolError(f"Unknown tool type {tool_def.type}")
+
+        labels = {"tool": tool_def.type.value, "function": function_name}
+        with self._tracer.start_span(f"{tool_def.type.value} {function_name}", kind=Span.KIND_CLIENT,
+                                     attributes={"aq.tool": tool_def.type.value, "aq.function": function_name}) as span:
+            # Models often repeat the same query or link within and across app jobs
+            response = self._cache.get(tool_def, function_name, arguments)
+            if span:
+                span.set_attribute("aq.cache_hit", response is not None)
+            if response is not None:
+                return response
+
+            start_time = time.perf_counter()
+            try:
+                response = await tool_obj.invoke(function_name, arguments, tool_def)
+            except Exception:
+                self._errors.inc(**labels)
+                raise
+            self._latency.observe(time.perf_counter() - start_time, **labels)
+            if tool_obj.is_cacheable(function_name, response):
+                self._cache.put(tool_def, function_name, arguments, response)
+            return response
@@ -65,6 +65,10 @@ class NewsTool(BaseTool):
         else:
             raise ToolError(f"Unknown function {function_name}")
 
+    def is_cacheable(self, function_name: str, response: str) -> bool:
+        news_response = NewsResponse.model_validate_json(response)
+        return bool(news_response.news and news_response.news.results)
+
     async def search(self, arguments: Dict[str, Any]) -> NewsResponse:
         query = arguments["query"]
         count = arguments.get("count", 20)
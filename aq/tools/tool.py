@@ -14,3 +14,7 @@ class BaseTool:
 
     async def invoke(self, function_name: str, arguments: Dict[str, Any], tool_def: ToolDef) -> str:
         pass
+
+    def is_cacheable(self, function_name: str, response: str) -> bool:
+        # Tools that report failures as empty results keep them out of the cache
+        return bool(response)
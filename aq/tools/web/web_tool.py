@@ -1,5 +1,4 @@
 import logging
-import tiktoken
 import asyncio
 
 from typing import Any, Dict, List, Optional
@@ -7,6 +6,7 @@ from typing import Any, Dict, List, Optional
 from bs4 import BeautifulSoup
 from pydantic import BaseModel
 
+from ...executor import Executor
 from ...http_client import AsyncHttpClient
 from ...providers.types import Tool
 from ...types import ToolDef
@@ -26,11 +26,11 @@ class SearchResponse(BaseModel):
 class WebTool(BaseTool):
     USER_AGENT = "Mozilla/5.0"
 
-    def __init__(self, config: Dict[str, Any], http_client: AsyncHttpClient):
+    def __init__(self, config: Dict[str, Any], http_client: AsyncHttpClient, executor: Optional[Executor] = None):
         self._config = config
         self._http_client = http_client
+        self._executor = executor or Executor()
         self._logger = logging.getLogger(self.__class__.__name__)
-        self._encoding = tiktoken.get_encoding("cl100k_base")
 
 
     async def get_metadata(self, tool_def: ToolDef) -> List[Tool]:
@@ -78,6 +78,11 @@ class WebTool(BaseTool):
         else:
             raise ToolError(f"Unknown function {function_name}")
 
+    def is_cacheable(self, function_name: str, response: str) -> bool:
+        if function_name == "search":
+            return bool(SearchResponse.model_validate_json(response).hits)
+        return bool(response)
+
     async def search(self, arguments: Dict[str, Any], tool_def: ToolDef) -> SearchResponse:
         query = arguments["query"]
         num_results = tool_def.parameters.get("results", 3)
@@ -118,14 +123,18 @@ class WebTool(BaseTool):
             "User-Agent": self.USER_AGENT
         }, json=False)
 
-        soup = BeautifulSoup(html, features="html.parser")
-        text = soup.get_text()
+        return await self._executor.run(html_to_text, html, max_characters)
+
+
+def html_to_text(html: str, max_characters: int) -> str:
+    soup = BeautifulSoup(html, features="html.parser")
+    text = soup.get_text()
+
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
 
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))        
-        
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        if len(text) > max_characters:
-            text = text[:max_characters] + "..."
+    text = '\n'.join(chunk for chunk in chunks if chunk)
+    if len(text) > max_characters:
+        text = text[:max_characters] + "..."
 
-        return text
+    return text
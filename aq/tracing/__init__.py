@@ -0,0 +1,10 @@
+from .tracer import Tracer, Span, FileSpanExporter, get_current_span, to_span_id, to_trace_id
+
+__all__ = [
+    "Tracer",
+    "Span",
+    "FileSpanExporter",
+    "get_current_span",
+    "to_span_id",
+    "to_trace_id"
+]
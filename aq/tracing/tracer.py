@@ -0,0 +1,178 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import secrets
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar("current_span", default=None)
+
+
+def get_current_span() -> Optional['Span']:
+    return current_span.get()
+
+
+def to_span_id(job_id: str) -> str:
+    # Spans of jobs take their ids from the job ids, so children can find their parents without a lookup
+    return job_id.replace("-", "")[:16]
+
+
+def to_trace_id(job_id: str) -> str:
+    return job_id.replace("-", "")[:32]
+
+
+class Span:
+    KIND_INTERNAL = 1
+    KIND_CLIENT = 3
+    STATUS_OK = 1
+    STATUS_ERROR = 2
+
+    def __init__(self, name: str, trace_id: str, span_id: Optional[str] = None, parent_id: Optional[str] = None,
+                 kind: int = KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id or secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+        self.status = self.STATUS_OK
+        self.message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def increment(self, key: str, amount: int = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def set_error(self, message: str) -> None:
+        self.status = self.STATUS_ERROR
+        self.message = message
+
+    def end(self) -> None:
+        if self.end_time is None:
+            self.end_time = time.time_ns()
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time or self.start_time),
+            "attributes": [{"key": key, "value": to_otlp_value(value)}
+                           for key, value in self.attributes.items() if value is not None],
+            "status": {"code": self.status, "message": self.message} if self.message else {"code": self.status}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class FileSpanExporter:
+    # Writes one OTLP/JSON ExportTraceServiceRequest per line
+    def __init__(self, path: str, service_name: str = "pyaq"):
+        self._path = path
+        self._service_name = service_name
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Span]) -> None:
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self._service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "aq"},
+                    "spans": [span.to_otlp() for span in spans]
+                }]
+            }]
+        }
+        with open(self._path, "a", encoding="utf-8") as trace_file:
+            trace_file.write(json.dumps(request) + "\n")
+
+
+class Tracer:
+    BATCH_SIZE = 256
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        path = config.get("path", None)
+        self._exporter = FileSpanExporter(path, config.get("service_name", "pyaq")) if path else None
+        self._batch: List[Span] = []
+        self._open_spans: Dict[str, Span] = {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    @property
+    def enabled(self) -> bool:
+        return self._exporter is not None
+
+    @contextlib.contextmanager
+    def start_span(self, name: str, trace_id: Optional[str] = None, span_id: Optional[str] = None,
+                   parent_id: Optional[str] = None, kind: int = Span.KIND_INTERNAL,
+                   attributes: Optional[Dict[str, Any]] = None) -> Iterator[Optional[Span]]:
+        # Spans without an explicit parent are children of the current span
+        if not self._exporter:
+            yield None
+            return
+
+        parent = current_span.get()
+        if not trace_id:
+            trace_id = parent.trace_id if parent else secrets.token_hex(16)
+            parent_id = parent_id or (parent.span_id if parent else None)
+
+        span = Span(name, trace_id, span_id, parent_id, kind, attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(str(e) or e.__class__.__name__)
+            raise
+        finally:
+            current_span.reset(token)
+            self.end_span(span)
+
+    def open_span(self, key: str, name: str, trace_id: str, span_id: Optional[str] = None,
+                  parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None) -> None:
+        # A span that is started and ended by different calls, like the span of an app job
+        if self._exporter and key not in self._open_spans:
+            self._open_spans[key] = Span(name, trace_id, span_id, parent_id, Span.KIND_INTERNAL, attributes)
+
+    def close_span(self, key: str, attributes: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        span = self._open_spans.pop(key, None)
+        if span:
+            span.attributes.update(attributes or {})
+            if error:
+                span.set_error(error)
+            self.end_span(span)
+            self.flush()
+
+    def end_span(self, span: Span) -> None:
+        span.end()
+        self._batch.append(span)
+        if len(self._batch) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._exporter or not self._batch:
+            return
+        spans, self._batch = self._batch, []
+        try:
+            self._exporter.export(spans)
+        except OSError as e:
+            self._logger.error(f"Failed to export {len(spans)} spans: {e}")
+
+
+def to_otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    elif isinstance(value, int):
+        return {"intValue": str(value)}
+    elif isinstance(value, float):
+        return {"doubleValue": value}
+    else:
+        return {"stringValue": str(value)}
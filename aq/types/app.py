@@ -62,6 +62,7 @@ class ActivityInput(BaseModel):
     activity: str
     map: Optional[str] = None
     batch_size: Optional[int] = 1
+    stream: Optional[bool] = False
 
 
 class Activity(BaseModel):
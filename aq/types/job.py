@@ -1,6 +1,6 @@
 import uuid
 from enum import Enum
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 from .app import App
 
@@ -11,6 +11,7 @@ class JobState(Enum):
     RUNNING = 2,
     SUCCESS = 3
     ERROR = 4
+    SKIPPED = 5
 
 
 class Usage:
@@ -38,13 +39,21 @@ class AppJob:
     def finished(self) -> bool:
         return self.state == JobState.SUCCESS or self.state == JobState.ERROR
 
+    @property
+    def root(self) -> 'AppJob':
+        # The app job at the bottom of the call stack
+        app_job = self
+        while app_job.caller:
+            app_job = app_job.caller.app_job
+        return app_job
+
 
 class ActivityJob:
     id: str
     activity_name: str
     app_job: AppJob
     state: JobState
-    output: str
+    output: Any
     output_type: str = "text/plain"
     usage: Usage
 
@@ -0,0 +1,198 @@
+# Runs the example apps at scale against a local mock of an OpenAI-compatible API and reports
+# the throughput, the latency of app jobs, and the overhead of the broker itself.
+# The requests go through OpenAIProvider, ModelLimits, AsyncHttpClient and JobScheduler as in production,
+# and the mock runs in its own process so that its CPU time is not counted as overhead.
+# Run from the root of the source tree: python -m benchmarks.e2e --files 1000
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import yaml
+
+from aq.containers import Container
+from aq.metrics import MetricsRegistry
+from benchmarks.mock_server import add_arguments
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The starting activity and the input file of each app that runs without external services
+APPS: Dict[str, Tuple[str, str]] = {
+    "investments": ("read_content", "meaning_of_life.txt"),
+    "extract": ("read_content", "email.txt"),
+    "enrich": ("read_content", "contacts.json")
+}
+
+
+def create_app_file(app_name: str, directory: str) -> str:
+    # Every model of the app is served by the mock
+    with open(os.path.join(ROOT, "examples", "apps", f"{app_name}.yml")) as app_file:
+        app_def = yaml.safe_load(app_file)
+    for model in app_def.get("models", {}).values():
+        model["provider"] = "openai"
+    app_path = os.path.join(directory, f"{app_name}.yml")
+    with open(app_path, "w") as app_file:
+        yaml.safe_dump(app_def, app_file)
+    return app_path
+
+
+def create_input_files(app_name: str, directory: str, count: int) -> List[str]:
+    # Text inputs differ from file to file, so that requests cannot be served from a cache
+    source = os.path.join(ROOT, "examples", "files", APPS[app_name][1])
+    extension = os.path.splitext(source)[1]
+    file_paths = []
+    for n in range(count):
+        file_path = os.path.join(directory, f"{app_name}_{n}{extension}")
+        if extension == ".txt":
+            with open(source) as source_file, open(file_path, "w") as input_file:
+                input_file.write(f"{source_file.read()}\nDocument {n}\n")
+        else:
+            shutil.copyfile(source, file_path)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def create_container(endpoint: str, args: argparse.Namespace, directory: str) -> Container:
+    container = Container()
+    container.config.from_yaml(os.path.join(ROOT, "config.yml"))
+    container.config.from_dict({
+        "log": {"level": "WARNING"},
+        "providers": {"openai": {
+            "key": "benchmark",
+            "endpoint": endpoint,
+            "requests_per_minute": args.requests_per_minute,
+            "tokens_per_minute": args.tokens_per_minute
+        }},
+        "tools": {"web": {"endpoint": f"{endpoint}/search", "key": "benchmark"}},
+        "jobs": {"store": "none", "retention": {"max_finished": args.files, "ttl": 3600}},
+        "memory": {"chromadb": {"path": os.path.join(directory, "data")}},
+        "http": {"cassette": {"mode": "off"}},
+        "tracing": {"path": None}
+    })
+    container.init_resources()
+    return container
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+
+def get_total(metrics: MetricsRegistry, sample_name: str) -> float:
+    # The sum of a metric or of a histogram series over all labels
+    metric = metrics.get_metric(sample_name.removesuffix("_sum").removesuffix("_count"))
+    if not metric:
+        return 0.0
+    return sum(value for name, _, value in metric.get_samples() if name == sample_name)
+
+
+async def run_app(container: Container, app_name: str, args: argparse.Namespace, directory: str) -> None:
+    broker = container.broker()
+    metrics = container.metrics()
+    app_file = create_app_file(app_name, directory)
+    file_paths = create_input_files(app_name, directory, args.files)
+
+    # An app job starts as soon as run_many takes its input
+    start_times: Dict[str, float] = {}
+
+    def inputs():
+        for file_path in file_paths:
+            start_times[file_path] = time.perf_counter()
+            yield file_path
+
+    latencies = []
+    failed = 0
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    async for file_path, outputs in broker.run_many(app_file, APPS[app_name][0], inputs(),
+                                                    max_in_flight=args.max_in_flight):
+        latencies.append(time.perf_counter() - start_times[file_path])
+        failed += 0 if outputs else 1
+    elapsed = time.perf_counter() - start_time
+    cpu = time.process_time() - start_cpu
+
+    activity_jobs = get_total(metrics, "aq_queue_wait_seconds_count")
+    queue_wait = get_total(metrics, "aq_queue_wait_seconds_sum")
+    print(f"{app_name}: {len(latencies)} app jobs, {failed} without outputs, {elapsed:.2f} sec.")
+    print(f"  throughput: {len(latencies) / elapsed:.1f} app jobs/sec.")
+    print(f"  latency: p50 {percentile(latencies, 0.5):.3f} sec., p99 {percentile(latencies, 0.99):.3f} sec.")
+    print(f"  model requests: {int(get_total(metrics, 'aq_provider_request_seconds_count'))}, "
+          f"429 retries: {int(get_total(metrics, 'aq_http_rate_limited_total'))}, "
+          f"throttled by ModelLimits: {int(get_total(metrics, 'aq_model_limits_throttled_total'))}")
+    print(f"  overhead: {1000 * cpu / max(len(latencies), 1):.2f} ms CPU per app job, "
+          f"{1000 * queue_wait / max(activity_jobs, 1):.2f} ms mean queue wait per activity job")
+
+
+async def wait_for_server(host: str, port: int, timeout: float = 10) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.e2e")
+    parser.add_argument("--apps", nargs="+", choices=list(APPS.keys()), default=["investments", "extract", "enrich"])
+    parser.add_argument("--files", type=int, default=1000, help="The number of input files of each app")
+    parser.add_argument("--max-in-flight", type=int, default=100, help="The max number of app jobs at once")
+    parser.add_argument("--requests-per-minute", type=int, default=100000,
+                        help="The request limit of the model, enforced by ModelLimits")
+    parser.add_argument("--tokens-per-minute", type=int, default=100000000,
+                        help="The token limit of the model, enforced by ModelLimits")
+    parser.add_argument("--endpoint", default=None,
+                        help="The endpoint of a mock that is already running, instead of starting one")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    endpoint = args.endpoint
+    if not endpoint:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        server_args = ["--port", str(port), "--latency", args.latency, "--mean", str(args.mean),
+                       "--sigma", str(args.sigma), "--rate-limit", str(args.rate_limit),
+                       "--retry-after", str(args.retry_after)]
+        if args.no_tool_calls:
+            server_args.append("--no-tool-calls")
+        if args.seed is not None:
+            server_args.extend(["--seed", str(args.seed)])
+        server = await asyncio.create_subprocess_exec(sys.executable, "-m", "benchmarks.mock_server", *server_args,
+                                                      stdout=asyncio.subprocess.DEVNULL)
+        await wait_for_server("127.0.0.1", port)
+        endpoint = f"http://127.0.0.1:{port}/v1"
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"Mock latency: {args.latency}, mean {args.mean} sec., sigma {args.sigma}, "
+          f"429 rate {args.rate_limit}")
+    # The write activities save their outputs in the working directory
+    directory = tempfile.mkdtemp(prefix="aq-e2e-")
+    os.chdir(directory)
+    try:
+        for app_name in args.apps:
+            # Each app gets a fresh broker, so that its metrics are not mixed with the others
+            container = create_container(endpoint, args, directory)
+            await run_app(container, app_name, args, directory)
+            await container.broker().stop()
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(directory, ignore_errors=True)
+        if server:
+            server.terminate()
+            await server.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
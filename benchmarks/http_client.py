@@ -0,0 +1,85 @@
+# Measures the overhead of an HTTP request made with a new client for each request, as AsyncHttpClient used to,
+# and with the pooled clients of AsyncHttpClient that keep connections alive between requests.
+# The mock answers right away and runs in its own process, so the times are the cost of the client and the connection.
+# Run from the root of the source tree: python -m benchmarks.http_client --requests 1000
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import time
+from typing import Awaitable, Callable, List
+
+import httpx
+
+from aq.http_client import AsyncHttpClient
+from benchmarks.e2e import percentile, wait_for_server
+
+REQUEST = json.dumps({"model": "mock", "messages": [{"role": "user", "content": "Say something"}]})
+HEADERS = {"Content-Type": "application/json"}
+
+
+async def post_with_new_client(url: str) -> None:
+    async with httpx.AsyncClient() as ac:
+        response = await ac.post(url, headers=HEADERS, content=REQUEST, timeout=AsyncHttpClient.TIMEOUT)
+    response.json()
+
+
+async def measure(name: str, post: Callable[[], Awaitable[None]], requests: int, concurrency: int) -> None:
+    latencies: List[float] = []
+
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            start_time = time.perf_counter()
+            await post()
+            latencies.append(time.perf_counter() - start_time)
+
+    counts = [requests // concurrency + (1 if n < requests % concurrency else 0) for n in range(concurrency)]
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    await asyncio.gather(*(worker(count) for count in counts))
+    elapsed = time.perf_counter() - start_time
+    cpu = time.process_time() - start_cpu
+
+    print(f"  {name}: {requests / elapsed:.0f} requests/sec., "
+          f"latency p50 {1000 * percentile(latencies, 0.5):.2f} ms, p99 {1000 * percentile(latencies, 0.99):.2f} ms, "
+          f"{1000 * cpu / requests:.3f} ms CPU per request")
+
+
+async def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.http_client")
+    parser.add_argument("--requests", type=int, default=1000, help="The number of requests of each run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 20],
+                        help="The number of requests in flight at once")
+    parser.add_argument("--endpoint", default=None,
+                        help="The endpoint of a mock that is already running, instead of starting one")
+    args = parser.parse_args()
+
+    server = None
+    endpoint = args.endpoint
+    if not endpoint:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        server = await asyncio.create_subprocess_exec(sys.executable, "-m", "benchmarks.mock_server",
+                                                      "--port", str(port), "--latency", "fixed", "--mean", "0",
+                                                      "--no-tool-calls", stdout=asyncio.subprocess.DEVNULL)
+        await wait_for_server("127.0.0.1", port)
+        endpoint = f"http://127.0.0.1:{port}/v1"
+    url = AsyncHttpClient.urljoin(endpoint, "/chat/completions")
+
+    http_client = AsyncHttpClient()
+    try:
+        for concurrency in args.concurrency:
+            print(f"{args.requests} requests, {concurrency} in flight")
+            await measure("new client per request", lambda: post_with_new_client(url), args.requests, concurrency)
+            await measure("pooled client", lambda: http_client.post(url, HEADERS, REQUEST), args.requests, concurrency)
+    finally:
+        await http_client.close()
+        if server:
+            server.terminate()
+            await server.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+# Measures the delay of the event loop while the CPU-bound paths of the broker run,
+# with the work done on the loop itself and in thread and process pools.
+# Run from the root of the source tree: python -m benchmarks.loop_lag
+import asyncio
+import time
+
+import markdown
+
+from aq.activities.readers import PdfReader, ReaderError
+from aq.executor import Executor
+from aq.memory.splitter import split_into_chunks
+from aq.metrics import LoopLagMonitor, MetricsRegistry
+from aq.providers.openai.provider import count_tokens
+from aq.tools.web.web_tool import html_to_text
+
+TASKS = 20
+PARTS = 200
+PDF_FILE = "examples/files/report.pdf"
+
+
+def create_text() -> str:
+    with open("examples/files/meaning_of_life.txt") as text_file:
+        text = text_file.read()
+    return "\n\n".join(f"## Part {n}\n\n- {text}" for n in range(PARTS))
+
+
+async def run(executor_type: str, text: str, html: str) -> None:
+    executor = Executor({"type": executor_type, "workers": 4})
+    pdf_reader = PdfReader(executor)
+    metrics = MetricsRegistry()
+    monitor = LoopLagMonitor(metrics, interval=0.01)
+
+    paths = {
+        "markdown": lambda: executor.run(markdown.markdown, text, tab_length=2),
+        "html": lambda: executor.run(html_to_text, html, 4000),
+        "sentences": lambda: executor.run(split_into_chunks, text, 2000),
+        "tokens": lambda: executor.run(count_tokens, text)
+    }
+
+    # Warm up the pool, so that starting the workers is not measured
+    try:
+        await pdf_reader.read(PDF_FILE)
+        paths["pdf"] = lambda: pdf_reader.read(PDF_FILE)
+    except ReaderError as e:
+        print(f"  pdf: skipped, {e}")
+
+    monitor.start()
+    await asyncio.sleep(0.05)
+    start_time = time.perf_counter()
+    for name, path in paths.items():
+        path_start_time = time.perf_counter()
+        await asyncio.gather(*(path() for _ in range(TASKS)))
+        print(f"  {name}: {time.perf_counter() - path_start_time:.3f} sec.")
+    elapsed = time.perf_counter() - start_time
+    await asyncio.sleep(0.05)
+    monitor.stop()
+    executor.shutdown()
+
+    lag = metrics.get_metric("aq_event_loop_lag_seconds").get()
+    print(f"{executor_type}: {elapsed:.3f} sec., max lag {1000 * monitor.max_lag:.1f} ms, "
+          f"mean lag {1000 * lag['sum'] / max(lag['count'], 1):.1f} ms over {lag['count']} ticks")
+
+
+async def main():
+    text = create_text()
+    html = f"<html><body>{markdown.markdown(text)}</body></html>"
+    for executor_type in [Executor.TYPE_NONE, Executor.TYPE_THREAD, Executor.TYPE_PROCESS]:
+        await run(executor_type, text, html)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,176 @@
+# A stand-in for an OpenAI-compatible API that serves /chat/completions with a configurable latency,
+# rejects a share of requests with 429 errors, and answers requests with tools with tool calls.
+# GET requests are answered with web search results, so apps with the web tool can run against it too.
+# Run from the root of the source tree: python -m benchmarks.mock_server --port 8790
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+LATENCY_DISTRIBUTIONS = ["fixed", "uniform", "lognormal"]
+
+
+class MockServer:
+    def __init__(self, latency: str = "lognormal", mean: float = 0.5, sigma: float = 0.5,
+                 rate_limit: float = 0.0, retry_after: int = 1, tool_calls: bool = True, seed: Optional[int] = None):
+        self._latency = latency
+        self._mean = mean
+        self._sigma = sigma
+        self._rate_limit = rate_limit
+        self._retry_after = retry_after
+        self._tool_calls = tool_calls
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.rate_limited = 0
+
+    def get_latency(self) -> float:
+        if self._latency == "fixed":
+            return self._mean
+        elif self._latency == "uniform":
+            return self._random.uniform(max(self._mean - self._sigma, 0), self._mean + self._sigma)
+        else:
+            # A lognormal distribution with the given mean, which has the long tail of real model latencies
+            mu = math.log(max(self._mean, 1e-6)) - self._sigma ** 2 / 2
+            return self._random.lognormvariate(mu, self._sigma)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, response_headers, response = await self.respond(method, path, body)
+                data = json.dumps(response).encode("utf-8")
+                head = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(data)}",
+                        *(f"{name}: {value}" for name, value in response_headers.items())]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, str], Any]:
+        self.requests += 1
+        await asyncio.sleep(self.get_latency())
+
+        if method == "GET":
+            return 200, {}, self.search(path)
+        if not path.split("?")[0].endswith("/chat/completions"):
+            return 404, {}, {"error": {"code": 404, "message": f"Unknown path {path}"}}
+
+        if self._random.random() < self._rate_limit:
+            self.rate_limited += 1
+            return 429, {"Retry-After": str(self._retry_after)}, {
+                "error": {"code": 429, "message": "Rate limit reached for requests"}
+            }
+
+        return 200, {}, self.complete(json.loads(body))
+
+    def complete(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        messages = request.get("messages", [])
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        tools = request.get("tools", None)
+
+        # A request with tools gets one round of tool calls, and the final answer once the results are back
+        if tools and self._tool_calls and not any(message.get("role") == "tool" for message in messages):
+            function = tools[0]["function"]
+            properties = function.get("parameters", {}).get("properties", {})
+            arguments = {name: f"{name} {self._random.randint(1, 1000)}" for name in properties}
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": function["name"], "arguments": json.dumps(arguments)}
+                }]
+            }
+            finish_reason = "tool_calls"
+        else:
+            if request.get("response_format", {}).get("type", None) == "json_object":
+                content = json.dumps({"result": {"answer": "A mock answer", "tokens": prompt_tokens}})
+            else:
+                content = "A mock answer. " * 20
+            message = {"role": "assistant", "content": content}
+            finish_reason = "stop"
+
+        completion_tokens = len(json.dumps(message)) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    def search(self, path: str) -> Dict[str, Any]:
+        return {"hits": [{
+            "title": f"Result {n}",
+            "snippets": [f"A snippet of result {n}"],
+            "description": f"A description of result {n}",
+            "url": f"https://example.com/{n}"
+        } for n in range(3)]}
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="lognormal",
+                        help="The distribution of the response latency")
+    parser.add_argument("--mean", type=float, default=0.5, help="The mean latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.5,
+                        help="The spread of the latency: the sigma of lognormal, or the half width of uniform")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="The share of chat completion requests rejected with a 429 error")
+    parser.add_argument("--retry-after", type=int, default=1,
+                        help="The value of the Retry-After header of 429 responses")
+    parser.add_argument("--no-tool-calls", action="store_true",
+                        help="Answer requests with tools without calling them")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def create_server(args: argparse.Namespace) -> MockServer:
+    return MockServer(args.latency, args.mean, args.sigma, args.rate_limit, args.retry_after,
+                      not args.no_tool_calls, args.seed)
+
+
+async def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.mock_server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = await asyncio.start_server(create_server(args).handle, args.host, args.port, backlog=4096)
+    print(f"Listening on http://{args.host}:{args.port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,64 @@
+# Measures the CPU time that the scheduler and activities spend passing a large JSON value
+# from one activity to the next, with structured outputs and with outputs serialized to text at every hop
+# as they used to be.
+# Run from the root of the source tree: python -m benchmarks.outputs
+import asyncio
+import json
+import time
+from typing import Any, Dict
+
+from aq.activities import FunctionActivity, MergeActivity
+from aq.jobs import JobManager, JobScheduler
+from aq.types import ActivityJob, App
+
+HOPS = 10
+ITEMS = 20000
+
+
+class SerializingFunctionActivity(FunctionActivity):
+    # The baseline: each hop parses the text of its input and serializes its output again
+    async def perform(self, activity_job: ActivityJob, inputs: Dict[str, Any]) -> None:
+        await super().perform(activity_job, inputs)
+        activity_job.output = json.dumps(activity_job.output, indent=2)
+
+
+def create_app() -> App:
+    activities = {"hop_0": {"type": "function"}}
+    for n in range(1, HOPS):
+        activities[f"hop_{n}"] = {"type": "function", "inputs": [{"activity": f"hop_{n - 1}"}]}
+    activities["result"] = {"type": "merge", "inputs": [{"activity": f"hop_{HOPS - 1}"}],
+                            "parameters": {"format": "json"}}
+
+    return App(**{
+        "aq": "0.0.1",
+        "info": {"id": "benchmarks.outputs", "title": "Outputs", "version": "1.0.0"},
+        "activities": activities
+    })
+
+
+async def run(data: str, function: FunctionActivity) -> float:
+    job_manager = JobManager()
+    merge = MergeActivity()
+    scheduler = JobScheduler({}, job_manager, None, None, None, None, None,
+                             None, None, function, function, merge)
+
+    app_job = job_manager.create_app_job(create_app())
+    activity_job = job_manager.create_activity_job(app_job, "hop_0")
+
+    start_time = time.process_time()
+    await scheduler.start_workers()
+    await scheduler.schedule(activity_job, {"data": data})
+    await scheduler.join()
+    return time.process_time() - start_time
+
+
+async def main():
+    data = json.dumps([{"id": n, "name": f"item {n}", "tags": ["a", "b", "c"]} for n in range(ITEMS)])
+    print(f"{ITEMS} items, {HOPS} hops")
+    for name, function in [("text", SerializingFunctionActivity()), ("structured", FunctionActivity())]:
+        duration = min([await run(data, function) for _ in range(3)])
+        print(f"  {name}: {duration:.3f} sec. CPU, {1000 * duration / HOPS:.1f} ms per hop")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
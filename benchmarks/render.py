@@ -0,0 +1,63 @@
+# Measures the throughput of prompt rendering for a map fan-out, where every job renders the same template,
+# and of JSONPath selection, with and without the caches of compiled templates and expressions.
+# Run from the root of the source tree: python -m benchmarks.render
+import contextlib
+import json
+import time
+from typing import Callable
+
+from aq.activities import activity
+from aq.activities.activity import BaseActivity, jsonpath
+
+RENDERS = 5000
+SELECTIONS = 5000
+
+TEMPLATE = """
+Answer the following question using the context below.
+
+Question: {{question.text}}
+Topic: {{question.topic}}
+
+Context:
+{% for line in context %}
+- {{ line }}
+{% endfor %}
+"""
+
+
+@contextlib.contextmanager
+def uncached():
+    # The baseline compiles every template and expression again, as before the caches were added
+    compile_template, compile_jsonpath = activity.compile_template, activity.compile_jsonpath
+    activity.compile_template = compile_template.__wrapped__
+    activity.compile_jsonpath = compile_jsonpath.__wrapped__
+    try:
+        yield
+    finally:
+        activity.compile_template, activity.compile_jsonpath = compile_template, compile_jsonpath
+
+
+def measure(name: str, count: int, func: Callable[[int], None]) -> None:
+    start_time = time.perf_counter()
+    for n in range(count):
+        func(n)
+    duration = time.perf_counter() - start_time
+    print(f"  {name}: {duration:.3f} sec., {count / duration:.0f} per sec.")
+
+
+def main():
+    inputs = [{
+        "question": json.dumps({"text": f"What is item {n}?", "topic": f"topic {n % 7}"}),
+        "context": [f"Item {n} is number {m}" for m in range(5)]
+    } for n in range(RENDERS)]
+    values = [{"contact": {"name": f"Name {n}", "emails": [f"name{n}@example.com"]}} for n in range(SELECTIONS)]
+
+    for name, context in [("uncached", uncached), ("cached", contextlib.nullcontext)]:
+        print(name)
+        with context():
+            measure("template renders", RENDERS, lambda n: BaseActivity.render(TEMPLATE, inputs[n]))
+            measure("jsonpath selections", SELECTIONS, lambda n: jsonpath(values[n], "$.contact.emails[0]"))
+
+
+if __name__ == "__main__":
+    main()
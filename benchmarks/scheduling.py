@@ -0,0 +1,72 @@
+# Compares the makespan of the fifo and critical_path scheduling policies.
+# Run from the root of the source tree: python -m benchmarks.scheduling
+import asyncio
+import time
+
+from aq.jobs import JobManager, JobScheduler
+from aq.types import App, ActivityJob, JobState
+
+# A wide app with a long chain of activities declared after many short independent ones
+LEAVES = 8
+CHAIN = 5
+DURATION = 0.05
+
+
+def create_app() -> App:
+    activities = {"read_content": {"type": "read"}}
+    for n in range(LEAVES):
+        activities[f"leaf_{n}"] = {"type": "generate", "models": ["model"],
+                                   "inputs": [{"activity": "read_content"}]}
+    previous = "read_content"
+    for n in range(CHAIN):
+        activities[f"chain_{n}"] = {"type": "generate", "models": ["model"],
+                                    "inputs": [{"activity": previous}]}
+        previous = f"chain_{n}"
+    activities["write_result"] = {"type": "merge",
+                                  "inputs": [{"activity": name} for name in activities if name != "read_content"]}
+
+    return App(**{
+        "aq": "0.0.1",
+        "info": {"id": "benchmarks.scheduling", "title": "Scheduling", "version": "1.0.0"},
+        "models": {"model": {"model": "model", "provider": "openai"}},
+        "activities": activities
+    })
+
+
+class SleepActivity:
+    def __init__(self, duration: float):
+        self._duration = duration
+
+    async def perform(self, activity_job: ActivityJob, inputs) -> None:
+        await asyncio.sleep(self._duration)
+        activity_job.state = JobState.SUCCESS
+        activity_job.output = activity_job.activity_name
+
+
+async def makespan(policy: str) -> float:
+    config = {"workers": 2, "policy": policy}
+    job_manager = JobManager()
+    sleep = SleepActivity(DURATION)
+    instant = SleepActivity(0)
+    scheduler = JobScheduler(config, job_manager, instant, instant, sleep, sleep, sleep,
+                             instant, instant, instant, instant, instant)
+
+    app_job = job_manager.create_app_job(create_app())
+    activity_job = job_manager.create_activity_job(app_job, "read_content")
+
+    start_time = time.perf_counter()
+    await scheduler.start_workers()
+    await scheduler.schedule(activity_job, {})
+    await scheduler.join()
+    return time.perf_counter() - start_time
+
+
+async def main():
+    lower_bound = max(CHAIN, (LEAVES + CHAIN + 1) // 2) * DURATION
+    print(f"Lower bound: {lower_bound:.3f} sec.")
+    for policy in ["fifo", "critical_path"]:
+        print(f"{policy}: {await makespan(policy):.3f} sec.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
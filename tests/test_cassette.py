@@ -0,0 +1,44 @@
+import asyncio
+import datetime
+from typing import Any, Dict
+
+from aq.activities import generate
+from aq.activities.generate import GenerateActivity
+from aq.http_client import AsyncHttpClient, CassetteHttpClient
+from aq.providers.types import ChatCompletionRequest
+from aq.types import App
+
+RESPONSE = {"choices": [{"index": 0, "message": {"role": "assistant", "content": "Hello"}}]}
+
+
+def create_body(today: datetime.date, monkeypatch) -> str:
+    class FixedDate(datetime.date):
+        @classmethod
+        def today(cls):
+            return today
+
+    monkeypatch.setattr(generate, "date", FixedDate)
+    app = App(**{
+        "aq": "0.0.1",
+        "info": {"id": "tests.cassette", "title": "Cassette", "version": "1.0.0"},
+        "activities": {"answer": {"type": "generate", "parameters": {"prompt": "Say hello"}}}
+    })
+    activity = GenerateActivity(None, None)
+    messages = activity.create_messages(app, app.activities["answer"], {}, False, False)
+    return ChatCompletionRequest(model="gpt", messages=messages).model_dump_json(exclude_none=True)
+
+
+def test_replay_on_a_different_date(tmp_path, monkeypatch):
+    config = {"mode": "record", "path": str(tmp_path / "cassette.jsonl")}
+
+    async def post(self, url: str, headers: Dict[str, Any], data: Any, json=True) -> Any:
+        return RESPONSE
+
+    monkeypatch.setattr(AsyncHttpClient, "post", post)
+    recorded_body = create_body(datetime.date(2024, 1, 1), monkeypatch)
+    asyncio.run(CassetteHttpClient(config).post("http://model/chat/completions", {}, recorded_body))
+
+    replayed_body = create_body(datetime.date(2024, 6, 30), monkeypatch)
+    assert replayed_body != recorded_body
+    replay = CassetteHttpClient({**config, "mode": "replay", "simulate_latency": False})
+    assert asyncio.run(replay.post("http://model/chat/completions", {}, replayed_body)) == RESPONSE
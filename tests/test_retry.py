@@ -0,0 +1,87 @@
+import pytest
+
+from aq.http_client import retry
+from aq.http_client.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def test_backoff_is_capped():
+    policy = RetryPolicy({"base_delay": 1, "max_delay": 10})
+    for attempt in range(10):
+        assert 0 <= policy.get_delay(attempt) <= min(10, 2 ** attempt)
+
+
+def test_retry_after():
+    policy = RetryPolicy({"base_delay": 1, "max_delay": 60})
+    assert 30 <= policy.get_delay(0, {"retry-after": "30"}) <= 31
+
+
+def test_retry_after_longer_than_max_delay():
+    policy = RetryPolicy({"max_delay": 60})
+    assert policy.get_delay(0, {"retry-after": "3600"}) is None
+
+
+def test_reset_of_used_up_limits_only():
+    policy = RetryPolicy({"base_delay": 0.1, "max_delay": 60})
+    headers = {
+        "x-ratelimit-reset-requests": "20ms",
+        "x-ratelimit-reset-tokens": "6m0s",
+        "x-ratelimit-remaining-tokens": "150000"
+    }
+    assert 0.02 <= policy.get_delay(0, headers, rate_limited=True) <= 0.12
+
+    headers["x-ratelimit-remaining-tokens"] = "0"
+    assert policy.get_delay(0, headers, rate_limited=True) is None
+
+
+def test_reset_only_when_rate_limited():
+    assert RetryPolicy.get_server_delay({"x-ratelimit-reset-requests": "1s"}) is None
+    assert RetryPolicy.get_server_delay({"x-ratelimit-reset-requests": "1s"}, rate_limited=True) == 1
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1.5", 1.5),
+    ("20ms", 0.02),
+    ("1s", 1),
+    ("6m0s", 360),
+    ("1h2m3s", 3723),
+    ("-1", 0),
+    ("soon", None),
+    ("1s later", None)
+])
+def test_parse_duration(value, expected):
+    duration = RetryPolicy.parse_duration(value)
+    if expected is None:
+        assert duration is None
+    else:
+        assert duration == pytest.approx(expected)
+
+
+def test_circuit_breaker(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(retry.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("host", failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.check()
+    assert breaker.state == CircuitBreaker.STATE_CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    # After the reset timeout one request probes the host, and a failure opens the circuit again
+    now[0] += 30
+    breaker.check()
+    assert breaker.state == CircuitBreaker.STATE_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.STATE_OPEN
+
+    # A successful probe closes the circuit
+    now[0] += 30
+    breaker.check()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.STATE_CLOSED
+    breaker.check()
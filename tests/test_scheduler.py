@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+from aq.activities import FunctionActivity, MergeActivity, ReturnActivity
+from aq.activities.activity import to_value
+from aq.jobs import JobManager, JobScheduler
+from aq.types import ActivityJob, App, AppJob, JobState
+
+
+class SlowActivity(FunctionActivity):
+    # Takes longer than the timeout for the item named slow, and reports an error for the item named bad
+    async def perform(self, activity_job: ActivityJob, inputs: Dict[str, Any]) -> None:
+        item = to_value(inputs["items"])
+        if item == "slow":
+            await asyncio.sleep(10)
+        if item == "bad":
+            activity_job.state = JobState.ERROR
+            activity_job.output = "bad item"
+            return
+        await super().perform(activity_job, inputs)
+
+
+def create_app() -> App:
+    return App(**{
+        "aq": "0.0.1",
+        "info": {"id": "tests.scheduler", "title": "Scheduler", "version": "1.0.0"},
+        "activities": {
+            "items": {"type": "function"},
+            "process": {"type": "summarize", "inputs": [{"activity": "items", "map": "$"}],
+                        "parameters": {"timeout": 0.2}},
+            "result": {"type": "function", "inputs": [{"activity": "process"}]},
+            "report": {"type": "function", "inputs": [{"activity": "result"}]}
+        }
+    })
+
+
+async def run_app(items) -> Tuple[JobManager, AppJob]:
+    job_manager = JobManager()
+    function = FunctionActivity()
+    scheduler = JobScheduler({}, job_manager, None, None, SlowActivity(), None, None, None, None,
+                             function, ReturnActivity(), MergeActivity())
+
+    app_job = job_manager.create_app_job(create_app())
+    await scheduler.start_workers()
+    await scheduler.schedule(job_manager.create_activity_job(app_job, "items"), {"items": items})
+    await asyncio.wait_for(scheduler.wait(app_job), 5)
+    await scheduler.join()
+    return job_manager, app_job
+
+
+def get_jobs(job_manager: JobManager, app_job: AppJob, activity_name: str) -> List[ActivityJob]:
+    return job_manager.activity_jobs[app_job.id].get(activity_name, [])
+
+
+def test_timeout_releases_downstream():
+    job_manager, app_job = asyncio.run(run_app(["a", "slow", "b"]))
+    assert sorted(get_jobs(job_manager, app_job, "result")[0].output) == ["a", "b"]
+
+
+def test_timeout_of_last_job_skips_downstream():
+    job_manager, app_job = asyncio.run(run_app(["slow"]))
+    assert [job.state for job in get_jobs(job_manager, app_job, "result")] == [JobState.SKIPPED]
+
+
+def test_error_releases_downstream():
+    job_manager, app_job = asyncio.run(run_app(["a", "bad", "b"]))
+    assert sorted(get_jobs(job_manager, app_job, "result")[0].output) == ["a", "b"]
+
+
+def test_failed_inputs_skip_downstream():
+    job_manager, app_job = asyncio.run(run_app(["bad", "bad"]))
+    assert [job.state for job in get_jobs(job_manager, app_job, "result")] == [JobState.SKIPPED]
+    assert [job.state for job in get_jobs(job_manager, app_job, "report")] == [JobState.SKIPPED]
+    assert job_manager.get_outputs(app_job) == {}
+    assert job_manager.get_summary(app_job)["skipped"] == {"result": 1, "report": 1}